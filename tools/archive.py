@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from cyclopts import App, Parameter
+
+from tools import configs
+from tools.configs import options
+from tools.configs.options import FontSize
+from tools.services import glyph_service
+
+app = App(
+    version=configs.version,
+    default_parameter=Parameter(consume_multiple=True),
+)
+
+
+def _sort_font_sizes(font_sizes: set[FontSize] | None) -> list[FontSize]:
+    if font_sizes is None:
+        return options.font_sizes
+    return sorted(font_sizes, key=lambda x: options.font_sizes.index(x))
+
+
+@app.command(name='export')
+def export_archives(font_sizes: set[FontSize] | None = None):
+    for font_size in _sort_font_sizes(font_sizes):
+        glyph_service.export_archive(font_size)
+
+
+@app.command(name='import')
+def import_archives(font_sizes: set[FontSize] | None = None, archive_file: Path | None = None):
+    for font_size in _sort_font_sizes(font_sizes):
+        glyph_service.import_archive(font_size, archive_file)
+
+
+if __name__ == '__main__':
+    app()
@@ -0,0 +1,52 @@
+import shutil
+
+from cyclopts import App, Parameter
+
+from tools import configs
+from tools.bench import cases, runner
+from tools.configs import path_define, options
+from tools.configs.options import FontSize
+from tools.services import font_service
+
+app = App(
+    version=configs.version,
+    default_parameter=Parameter(consume_multiple=True),
+)
+
+
+@app.default
+def main(
+        font_sizes: set[FontSize] | None = None,
+        names: set[str] | None = None,
+        repeat: int = 5,
+        save_baseline: bool = False,
+        threshold: float = 1.2,
+):
+    if font_sizes is None:
+        font_sizes = options.font_sizes
+    else:
+        font_sizes = sorted(font_sizes, key=lambda x: options.font_sizes.index(x))
+
+    benchmarks = cases.create_import_benchmarks()
+    for font_size in font_sizes:
+        benchmarks.extend(cases.create_benchmarks(font_size))
+    if font_sizes == options.font_sizes:
+        benchmarks.extend(cases.create_image_benchmarks(font_service.load_design_contexts(font_sizes)))
+    if names is not None:
+        benchmarks = [benchmark for benchmark in benchmarks if any(name in benchmark.name for name in names)]
+
+    results = [runner.run_benchmark(benchmark, repeat) for benchmark in benchmarks]
+
+    results_file_path = path_define.bench_dir.joinpath('results.json')
+    baseline_file_path = path_define.bench_dir.joinpath('baseline.json')
+    runner.save_results(results, results_file_path)
+    if save_baseline:
+        shutil.copyfile(results_file_path, baseline_file_path)
+    elif baseline_file_path.is_file():
+        regressions = runner.compare_results(results, baseline_file_path, threshold)
+        if len(regressions) > 0:
+            raise SystemExit(f'performance regressions: {', '.join(regressions)}')
+
+
+if __name__ == '__main__':
+    app()
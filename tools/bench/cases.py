@@ -0,0 +1,109 @@
+import random
+import subprocess
+import sys
+
+from pixel_font_knife import glyph_mapping_util
+from pixel_font_knife.glyph_file_util import GlyphFlavorGroup
+
+from tools import configs
+from tools.bench.runner import Benchmark
+from tools.configs import path_define, options
+from tools.configs.options import FontSize
+from tools.services import coverage_service, glyph_service, info_service, template_service, image_service
+from tools.services.font_service import DesignContext
+
+
+def _load_glyph_files(font_size: FontSize) -> dict[int, GlyphFlavorGroup]:
+    glyph_files = {}
+    for context in glyph_service.load_contexts(font_size, False).values():
+        glyph_files.update(context)
+    return glyph_files
+
+
+def _copy_glyph_files(glyph_files: dict[int, GlyphFlavorGroup]) -> dict[int, GlyphFlavorGroup]:
+    return {code_point: GlyphFlavorGroup(flavor_group) for code_point, flavor_group in glyph_files.items()}
+
+
+def _apply_mappings(glyph_files: dict[int, GlyphFlavorGroup]):
+    for mapping in configs.mappings:
+        glyph_mapping_util.apply_mapping(glyph_files, mapping)
+
+
+def _import_module(module_name: str):
+    subprocess.run([sys.executable, '-c', f'import {module_name}'], cwd=path_define.project_root_dir, check=True)
+
+
+def _create_synthetic_demo_html(alphabet: set[str], size: int) -> str:
+    rng = random.Random(size)
+    covered_chars = sorted(c for c in alphabet if c.isprintable() and c not in '<>&')
+    uncovered_chars = [chr(code_point) for code_point in range(0x4E00, 0x9FFF) if chr(code_point) not in alphabet]
+    paragraphs = []
+    total_size = 0
+    while total_size < size:
+        chars = []
+        for _ in range(rng.randint(64, 512)):
+            if rng.random() < 0.1:
+                chars.append(' ')
+            elif rng.random() < 0.2:
+                chars.append(rng.choice(uncovered_chars))
+            else:
+                chars.append(rng.choice(covered_chars))
+        paragraph = f'<p class="content">{''.join(chars)}<br>&amp; <a href="#">{''.join(rng.sample(covered_chars, 8))}</a></p>\n'
+        paragraphs.append(paragraph)
+        total_size += len(paragraph)
+    return ''.join(paragraphs)
+
+
+def _segment_demo_html(alphabet: set[str], content_html: str) -> str:
+    return ''.join(template_service.iter_demo_html_segments(template_service.compile_covered_pattern(alphabet), content_html))
+
+
+def create_import_benchmarks() -> list[Benchmark]:
+    return [
+        Benchmark('import-python', lambda _: _import_module('sys'), in_subprocess=True),
+        Benchmark('import-cli', lambda _: _import_module('tools.cli'), in_subprocess=True),
+    ]
+
+
+def create_benchmarks(font_size: FontSize) -> list[Benchmark]:
+    design_context = DesignContext.load(font_size)
+    glyph_files = _load_glyph_files(font_size)
+
+    benchmarks = [
+        Benchmark(f'glyph-context-load-{font_size}px', lambda _: _load_glyph_files(font_size)),
+        Benchmark(f'glyph-context-load-{font_size}px-cached', lambda _: DesignContext.load(font_size)),
+        Benchmark(f'glyph-context-load-{font_size}px-archive', lambda _: DesignContext.load(font_size, use_archive=True), lambda: glyph_service.export_archive(font_size)),
+        Benchmark(f'mappings-apply-{font_size}px', _apply_mappings, lambda: _copy_glyph_files(glyph_files)),
+        Benchmark(f'kerning-values-{font_size}px', lambda context: context.kerning_values, lambda: DesignContext(font_size, design_context._glyph_files)),
+    ]
+    for language_flavor in options.language_flavors:
+        benchmarks.append(Benchmark(f'create-builder-{font_size}px-{language_flavor}', lambda _, language_flavor=language_flavor: design_context._create_builder(language_flavor)))
+    builder = design_context._create_builder('zh_cn')
+    for font_format in options.font_formats:
+        benchmarks.append(Benchmark(f'save-{font_size}px-{font_format}', lambda _, font_format=font_format: design_context._make_font_files(builder, 'zh_cn', [font_format])))
+    for font_format in options.font_collection_formats:
+        benchmarks.append(Benchmark(f'save-{font_size}px-{font_format}', lambda _, font_format=font_format: design_context._make_font_collection_files([font_format])))
+    class_kerning_design_context = DesignContext(font_size, design_context._glyph_files, 'class')
+    class_kerning_builder = class_kerning_design_context._create_builder('zh_cn')
+    benchmarks.append(Benchmark(f'save-{font_size}px-otf-class-kerning', lambda _: class_kerning_design_context._make_font_files(class_kerning_builder, 'zh_cn', ['otf'])))
+    benchmarks.extend([
+        Benchmark('coverage-index-build', lambda _: coverage_service.CoverageIndex.build()),
+        Benchmark(f'make-info-{font_size}px', lambda _: info_service.make_info(design_context)),
+        Benchmark(f'make-demo-html-{font_size}px', lambda _: template_service.make_demo_html(design_context)),
+    ])
+    for size in (1024 * 1024, 4 * 1024 * 1024):
+        content_html = _create_synthetic_demo_html(design_context.alphabet, size)
+        benchmarks.append(Benchmark(f'segment-demo-html-{font_size}px-{size // 1024 // 1024}mb', lambda _, content_html=content_html: _segment_demo_html(design_context.alphabet, content_html)))
+    return benchmarks
+
+
+def create_image_benchmarks(design_contexts: dict[FontSize, DesignContext]) -> list[Benchmark]:
+    benchmarks = [Benchmark(f'make-preview-image-{font_size}px', lambda _, design_context=design_context: image_service.make_preview_image(design_context)) for font_size, design_context in design_contexts.items()]
+    benchmarks.extend([
+        Benchmark('make-readme-banner', lambda _: image_service.make_readme_banner(design_contexts)),
+        Benchmark('make-github-banner', lambda _: image_service.make_github_banner(design_contexts)),
+        Benchmark('make-itch-io-banner', lambda _: image_service.make_itch_io_banner(design_contexts)),
+        Benchmark('make-itch-io-cover', lambda _: image_service.make_itch_io_cover(design_contexts)),
+        Benchmark('make-afdian-cover', lambda _: image_service.make_afdian_cover(design_contexts)),
+    ])
+    return benchmarks
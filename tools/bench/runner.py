@@ -0,0 +1,134 @@
+import json
+import platform
+import resource
+import statistics
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from tools import configs
+
+
+class Benchmark:
+    name: str
+    run: Callable[[Any], object]
+    prepare: Callable[[], Any] | None
+    in_subprocess: bool
+
+    def __init__(
+            self,
+            name: str,
+            run: Callable[[Any], object],
+            prepare: Callable[[], Any] | None = None,
+            in_subprocess: bool = False,
+    ):
+        self.name = name
+        self.run = run
+        self.prepare = prepare
+        self.in_subprocess = in_subprocess
+
+
+class BenchmarkResult:
+    name: str
+    wall_times: list[float]
+    cpu_times: list[float]
+    peak_memory: int | None
+
+    def __init__(
+            self,
+            name: str,
+            wall_times: list[float],
+            cpu_times: list[float],
+            peak_memory: int | None,
+    ):
+        self.name = name
+        self.wall_times = wall_times
+        self.cpu_times = cpu_times
+        self.peak_memory = peak_memory
+
+    @property
+    def wall_time(self) -> float:
+        return statistics.median(self.wall_times)
+
+    @property
+    def cpu_time(self) -> float:
+        return statistics.median(self.cpu_times)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            'wall_time': self.wall_time,
+            'wall_time_min': min(self.wall_times),
+            'cpu_time': self.cpu_time,
+            'peak_memory': self.peak_memory,
+            'repeat': len(self.wall_times),
+        }
+
+
+def _get_cpu_time(in_subprocess: bool) -> float:
+    if in_subprocess:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+    return time.process_time()
+
+
+def run_benchmark(benchmark: Benchmark, repeat: int) -> BenchmarkResult:
+    wall_times = []
+    cpu_times = []
+    for _ in range(repeat):
+        state = None if benchmark.prepare is None else benchmark.prepare()
+        wall_start = time.perf_counter()
+        cpu_start = _get_cpu_time(benchmark.in_subprocess)
+        benchmark.run(state)
+        cpu_times.append(_get_cpu_time(benchmark.in_subprocess) - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+
+    # Tracing allocations slows everything down, so peak memory gets its own untimed pass.
+    # tracemalloc cannot see into a child process, so subprocess cases report no peak memory.
+    peak_memory = None
+    if not benchmark.in_subprocess:
+        state = None if benchmark.prepare is None else benchmark.prepare()
+        tracemalloc.start()
+        try:
+            benchmark.run(state)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    result = BenchmarkResult(benchmark.name, wall_times, cpu_times, peak_memory)
+    if result.peak_memory is None:
+        logger.info('Bench {}: wall = {:.4f}s, cpu = {:.4f}s', result.name, result.wall_time, result.cpu_time)
+    else:
+        logger.info('Bench {}: wall = {:.4f}s, cpu = {:.4f}s, peak memory = {:.1f} KiB', result.name, result.wall_time, result.cpu_time, result.peak_memory / 1024)
+    return result
+
+
+def save_results(results: list[BenchmarkResult], file_path: Path):
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(json.dumps({
+        'version': configs.version,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': {result.name: result.to_json() for result in results},
+    }, indent=2), 'utf-8')
+    logger.info("Save bench results: '{}'", file_path)
+
+
+def compare_results(results: list[BenchmarkResult], baseline_file_path: Path, threshold: float) -> list[str]:
+    baseline = json.loads(baseline_file_path.read_bytes())['results']
+    regressions = []
+    for result in results:
+        if result.name not in baseline:
+            logger.info('Bench {}: no baseline', result.name)
+            continue
+        baseline_wall_time = baseline[result.name]['wall_time']
+        ratio = result.wall_time / baseline_wall_time if baseline_wall_time > 0 else 1
+        if ratio > threshold:
+            regressions.append(result.name)
+            logger.warning('Bench {}: {:.4f}s -> {:.4f}s ({:+.1%})', result.name, baseline_wall_time, result.wall_time, ratio - 1)
+        else:
+            logger.info('Bench {}: {:.4f}s -> {:.4f}s ({:+.1%})', result.name, baseline_wall_time, result.wall_time, ratio - 1)
+    return regressions
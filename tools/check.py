@@ -1,11 +1,52 @@
+from pathlib import Path
+from typing import Literal
+
+from cyclopts import App, Parameter
+from loguru import logger
+
+from tools import configs
 from tools.configs import options
-from tools.services import check_service
+from tools.services import change_service, check_service
+
+app = App(
+    version=configs.version,
+    default_parameter=Parameter(consume_multiple=True),
+)
+
 
+@app.default
+def main(
+        changed_since: str | None = None,
+        files: list[Path] | None = None,
+        report_format: Literal['text', 'json'] = 'text',
+        report_file: Path | None = None,
+):
+    changed_file_paths = change_service.get_changed_file_paths(changed_since, files)
 
-def main():
+    violations = []
     for font_size in options.font_sizes:
-        check_service.check_glyphs(font_size)
+        code_points = change_service.get_glyph_code_points(changed_file_paths, font_size)
+        if code_points is not None:
+            code_points = change_service.get_mapping_dependents(changed_file_paths, code_points)
+        violations.extend(check_service.check_glyphs(font_size, code_points))
+
+    if change_service.is_tools_changed(changed_file_paths):
+        violations.extend(check_service.check_cli_imports())
+
+    if report_format == 'json':
+        report = check_service.format_report_json(violations)
+    else:
+        report = check_service.format_report_text(violations)
+    if report_file is None:
+        print(report)
+    else:
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        report_file.write_text(report, 'utf-8')
+        logger.info("Make check report: '{}'", report_file)
+
+    if len(violations) > 0:
+        raise SystemExit(1)
 
 
 if __name__ == '__main__':
-    main()
+    app()
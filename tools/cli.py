@@ -1,13 +1,21 @@
 import shutil
-from typing import Literal
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+from typing import Literal, TYPE_CHECKING
 
 from cyclopts import App, Parameter
 from loguru import logger
 
 from tools import configs
 from tools.configs import path_define, options
-from tools.configs.options import FontSize, FontFormat, Attachment
-from tools.services import font_service, publish_service, info_service, template_service, image_service
+from tools.configs.options import FontSize, LanguageFlavor, FontFormat, FontCollectionFormat, Attachment, KerningMode
+from tools.services import manifest_service, trace_service
+from tools.services.manifest_service import BuildManifest
+from tools.services.task_service import TaskGraph
+
+if TYPE_CHECKING:
+    from tools.services.font_service import DesignContext
 
 app = App(
     version=configs.version,
@@ -19,8 +27,15 @@ app = App(
 def main(
         cleanup: bool = False,
         font_sizes: set[FontSize] | None = None,
-        font_formats: set[FontFormat] | None = None,
+        font_formats: set[FontFormat | FontCollectionFormat] | None = None,
         attachments: set[Attachment | Literal['all']] | None = None,
+        jobs: int = 1,
+        cache: bool = True,
+        glyph_archive: bool = False,
+        kerning_mode: KerningMode = 'pair',
+        incremental: bool = False,
+        watch: bool = False,
+        trace: Path | None = None,
 ):
     if font_sizes is None:
         font_sizes = options.font_sizes
@@ -29,7 +44,7 @@ def main(
     if font_formats is None:
         font_formats = options.font_formats
     else:
-        font_formats = sorted(font_formats, key=lambda x: options.font_formats.index(x))
+        font_formats = sorted(font_formats, key=lambda x: [*options.font_formats, *options.font_collection_formats].index(x))
     if attachments is None:
         attachments = []
     elif 'all' in attachments:
@@ -42,47 +57,268 @@ def main(
     logger.info('font_sizes = {}', font_sizes)
     logger.info('font_formats = {}', font_formats)
     logger.info('attachments = {}', attachments)
+    logger.info('jobs = {}', jobs)
+    logger.info('cache = {}', cache)
+    logger.info('glyph_archive = {}', glyph_archive)
+    logger.info('kerning_mode = {}', kerning_mode)
+    logger.info('incremental = {}', incremental)
+    logger.info('watch = {}', watch)
+    logger.info('trace = {}', trace)
+
+    if trace is not None:
+        trace_service.enable()
+
+    if cleanup:
+        for dir_path in (path_define.outputs_dir, path_define.releases_dir):
+            if dir_path.exists():
+                shutil.rmtree(dir_path)
+                logger.info("Delete dir: '{}'", dir_path)
+
+    manifest = BuildManifest.load() if incremental or watch else None
+
+    from tools.services import font_service
+
+    design_contexts = font_service.load_design_contexts(font_sizes, cache, glyph_archive, kerning_mode)
+
+    graph = _create_task_graph(design_contexts, font_formats, attachments, all_font_sizes, jobs, manifest)
+    graph.run(jobs)
 
-    if cleanup and path_define.build_dir.exists():
-        shutil.rmtree(path_define.build_dir)
-        logger.info("Delete dir: '{}'", path_define.build_dir)
+    if manifest is not None:
+        manifest.save()
 
-    design_contexts = font_service.load_design_contexts(font_sizes)
-    for design_context in design_contexts.values():
-        design_context.make_fonts(font_formats)
+    if trace is not None:
+        trace_service.save_chrome_trace(trace)
+        trace_service.log_summary()
+
+    if watch:
+        from tools.services import watch_service
+
+        watch_service.watch(partial(_on_watch_change, design_contexts, font_formats, attachments, all_font_sizes, jobs, cache, manifest))
+
+
+def _create_task_graph(
+        design_contexts: dict[FontSize, DesignContext],
+        font_formats: list[FontFormat | FontCollectionFormat],
+        attachments: list[Attachment],
+        all_font_sizes: bool,
+        jobs: int,
+        manifest: BuildManifest | None,
+        changed_language_flavors: dict[FontSize, list[LanguageFlavor]] | None = None,
+) -> TaskGraph:
+    font_sizes = list(design_contexts)
+    graph = TaskGraph()
+    for font_size in font_sizes:
+        if changed_language_flavors is None:
+            graph.add(f'font-{font_size}px', partial(design_contexts[font_size].make_fonts, font_formats, jobs, manifest), exclusive=True)
+        else:
+            graph.add(f'font-{font_size}px', partial(_remake_fonts, manifest, design_contexts[font_size], font_formats, jobs, changed_language_flavors.get(font_size, [])), exclusive=True)
 
     if 'release' in attachments:
         for font_size in font_sizes:
-            publish_service.make_release_zips(font_size, font_formats)
+            for font_format in font_formats:
+                graph.add(f'release-{font_size}px-{font_format}', partial(_make_release_zip, manifest, font_size, font_format), [f'font-{font_size}px'])
 
     if 'info' in attachments:
         for font_size in font_sizes:
-            design_context = design_contexts[font_size]
-            info_service.make_info(design_context)
+            graph.add(f'info-{font_size}px', partial(_make_info, manifest, design_contexts[font_size]))
 
     if 'alphabet' in attachments:
         for font_size in font_sizes:
-            design_context = design_contexts[font_size]
-            info_service.make_alphabet_txt(design_context)
+            graph.add(f'alphabet-{font_size}px', partial(_make_alphabet_txt, manifest, design_contexts[font_size]))
+
+    if 'kerning' in attachments:
+        for font_size in font_sizes:
+            graph.add(f'kerning-{font_size}px', partial(_make_kerning_report, manifest, design_contexts[font_size]))
+
+    use_webfonts = 'webfont' in attachments
+    if use_webfonts:
+        for font_size in font_sizes:
+            graph.add(f'webfont-{font_size}px', partial(_make_webfonts, manifest, font_size), [f'font-{font_size}px'])
 
+    use_subsets = 'subset' in attachments
     if 'html' in attachments:
         for font_size in font_sizes:
-            design_context = design_contexts[font_size]
-            template_service.make_alphabet_html(design_context)
-            template_service.make_demo_html(design_context)
+            graph.add(f'html-{font_size}px', partial(_make_html, manifest, design_contexts[font_size], use_webfonts, use_subsets), [f'font-{font_size}px'] if use_subsets else None)
         if all_font_sizes:
-            template_service.make_index_html()
-            template_service.make_playground_html()
+            graph.add('html', partial(_make_common_html, manifest, use_webfonts, use_subsets), [f'font-{font_size}px' for font_size in font_sizes] if use_subsets else None)
 
     if 'image' in attachments:
         for font_size in font_sizes:
-            image_service.make_preview_image(font_size)
+            graph.add(f'image-{font_size}px', partial(_make_preview_image, manifest, design_contexts[font_size]))
         if all_font_sizes:
-            image_service.make_readme_banner(design_contexts)
-            image_service.make_github_banner(design_contexts)
-            image_service.make_itch_io_banner(design_contexts)
-            image_service.make_itch_io_cover()
-            image_service.make_afdian_cover()
+            graph.add('image', partial(_make_banners, manifest, design_contexts))
+
+    return graph
+
+
+def _remake_fonts(manifest: BuildManifest | None, design_context: DesignContext, font_formats: list[FontFormat | FontCollectionFormat], jobs: int, language_flavors: list[LanguageFlavor]):
+    if len(language_flavors) == 0:
+        return
+    priority_font_formats = [font_format for font_format in font_formats if font_format == 'otf.woff2']
+    design_context.make_fonts(priority_font_formats, jobs, manifest, language_flavors)
+    design_context.make_fonts([font_format for font_format in font_formats if font_format not in priority_font_formats], jobs, manifest, language_flavors)
+
+
+def _on_watch_change(
+        design_contexts: dict[FontSize, DesignContext],
+        font_formats: list[FontFormat | FontCollectionFormat],
+        attachments: list[Attachment],
+        all_font_sizes: bool,
+        jobs: int,
+        cache: bool,
+        manifest: BuildManifest,
+        changed_file_paths: set[Path],
+):
+    from tools.services import font_service
+
+    changed_language_flavors = {design_context.font_size: language_flavors for design_context, language_flavors in font_service.reload_design_contexts(list(design_contexts.values()), changed_file_paths, cache).items()}
+    _create_task_graph(design_contexts, font_formats, attachments, all_font_sizes, jobs, manifest, changed_language_flavors).run(jobs)
+    manifest.save()
+
+
+def _run_stage(
+        manifest: BuildManifest | None,
+        name: str,
+        get_digest: Callable[[], str],
+        make: Callable[[], list[Path]],
+):
+    if manifest is None:
+        make()
+    else:
+        manifest.run(name, get_digest(), make)
+
+
+def _make_release_zip(manifest: BuildManifest | None, font_size: FontSize, font_format: FontFormat | FontCollectionFormat):
+    from tools.services import font_service, publish_service
+
+    _run_stage(
+        manifest,
+        f'release-{font_size}px-{font_format}',
+        lambda: manifest_service.digest_values(
+            manifest_service.digest_files([path_define.project_root_dir.joinpath('LICENSE-OFL'), *font_service.get_font_file_paths(font_size, font_format)]),
+            publish_service.compress_levels[font_format],
+        ),
+        lambda: publish_service.make_release_zips(font_size, [font_format]),
+    )
+
+
+def _make_info(manifest: BuildManifest | None, design_context: DesignContext):
+    from tools.services import info_service
+
+    _run_stage(
+        manifest,
+        f'info-{design_context.font_size}px',
+        lambda: manifest_service.digest_values(sorted(design_context.alphabet)),
+        lambda: [info_service.make_info(design_context)],
+    )
+
+
+def _make_alphabet_txt(manifest: BuildManifest | None, design_context: DesignContext):
+    from tools.services import info_service
+
+    _run_stage(
+        manifest,
+        f'alphabet-{design_context.font_size}px',
+        lambda: manifest_service.digest_values(sorted(design_context.alphabet)),
+        lambda: [info_service.make_alphabet_txt(design_context)],
+    )
+
+
+def _make_kerning_report(manifest: BuildManifest | None, design_context: DesignContext):
+    from tools.services import kerning_service
+
+    _run_stage(
+        manifest,
+        f'kerning-{design_context.font_size}px',
+        lambda: manifest_service.digest_values(sorted(design_context.kerning_values.items())),
+        lambda: [kerning_service.make_kerning_report(design_context.font_size, design_context.kerning_values)],
+    )
+
+
+def _make_html(manifest: BuildManifest | None, design_context: DesignContext, use_webfonts: bool, use_subsets: bool):
+    from tools.services import font_service, template_service
+
+    _run_stage(
+        manifest,
+        f'html-{design_context.font_size}px',
+        lambda: manifest_service.digest_values(
+            sorted(design_context.alphabet),
+            vars(configs.font_configs[design_context.font_size]),
+            manifest_service.digest_dir(path_define.templates_dir),
+            use_webfonts,
+            manifest_service.digest_files(font_service.get_font_file_paths(design_context.font_size, 'otf.woff2')) if use_subsets else None,
+        ),
+        lambda: [
+            template_service.make_alphabet_html(design_context, use_webfonts, use_subsets),
+            template_service.make_demo_html(design_context, use_webfonts, use_subsets),
+        ],
+    )
+
+
+def _make_common_html(manifest: BuildManifest | None, use_webfonts: bool, use_subsets: bool):
+    from tools.services import font_service, template_service
+
+    _run_stage(
+        manifest,
+        'html',
+        lambda: manifest_service.digest_values(
+            [vars(font_config) for font_config in configs.font_configs.values()],
+            manifest_service.digest_dir(path_define.templates_dir),
+            use_webfonts,
+            manifest_service.digest_files(file_path for font_size in configs.font_configs for file_path in font_service.get_font_file_paths(font_size, 'otf.woff2')) if use_subsets else None,
+        ),
+        lambda: [
+            template_service.make_index_html(use_webfonts, use_subsets),
+            template_service.make_playground_html(use_webfonts),
+        ],
+    )
+
+
+def _make_webfonts(manifest: BuildManifest | None, font_size: FontSize):
+    from tools.services import font_service, webfont_service
+
+    _run_stage(
+        manifest,
+        f'webfont-{font_size}px',
+        lambda: manifest_service.digest_files(font_service.get_font_file_paths(font_size, 'otf.woff2')),
+        lambda: webfont_service.make_webfonts(font_size),
+    )
+
+
+def _get_design_digest(design_context: DesignContext) -> str:
+    return manifest_service.digest_values(*(design_context.get_flavor_digest(language_flavor) for language_flavor in options.language_flavors))
+
+
+def _make_preview_image(manifest: BuildManifest | None, design_context: DesignContext):
+    from tools.services import image_service
+
+    _run_stage(
+        manifest,
+        f'image-{design_context.font_size}px',
+        lambda: _get_design_digest(design_context),
+        lambda: [image_service.make_preview_image(design_context)],
+    )
+
+
+def _make_banners(manifest: BuildManifest | None, design_contexts: dict[FontSize, DesignContext]):
+    from tools.services import image_service
+
+    _run_stage(
+        manifest,
+        'image',
+        lambda: manifest_service.digest_values(
+            [sorted(design_context.alphabet) for design_context in design_contexts.values()],
+            [_get_design_digest(design_context) for design_context in design_contexts.values()],
+            manifest_service.digest_dir(path_define.images_dir),
+        ),
+        lambda: [
+            image_service.make_readme_banner(design_contexts),
+            image_service.make_github_banner(design_contexts),
+            image_service.make_itch_io_banner(design_contexts),
+            image_service.make_itch_io_cover(design_contexts),
+            image_service.make_afdian_cover(design_contexts),
+        ],
+    )
 
 
 if __name__ == '__main__':
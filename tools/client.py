@@ -0,0 +1,53 @@
+import json
+import socket
+import sys
+
+from tools.configs import path_define
+
+
+def _forward(command: str, args: list[str]) -> int | None:
+    if not hasattr(socket, 'AF_UNIX') or not path_define.daemon_socket_file_path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(path_define.daemon_socket_file_path))
+            client.sendall(json.dumps({'command': command, 'args': args}).encode('utf-8') + b'\n')
+            with client.makefile('r', encoding='utf-8') as file:
+                for line in file:
+                    message = json.loads(line)
+                    if 'stream' in message:
+                        stream = sys.stdout if message['stream'] == 'stdout' else sys.stderr
+                        stream.write(message['text'])
+                        stream.flush()
+                    elif 'exit_code' in message:
+                        if 'error' in message:
+                            print(f"Daemon rejected request: {message['error']}", file=sys.stderr)
+                        return message['exit_code']
+                    elif 'unavailable' in message:
+                        print(f"Daemon unavailable: {message['unavailable']}", file=sys.stderr)
+                        return None
+    except (ConnectionError, FileNotFoundError):
+        return None
+    raise RuntimeError('daemon closed connection unexpectedly')
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) == 0:
+        print('usage: python -m tools.client {build,check,format,info,status,stop} [args...]', file=sys.stderr)
+        return 2
+    command, args = argv[0], argv[1:]
+
+    exit_code = _forward(command, args)
+    if exit_code is not None:
+        return exit_code
+    if command in ('status', 'stop'):
+        print('Daemon not running', file=sys.stderr)
+        return 1
+
+    from tools.services import daemon_service
+
+    return daemon_service.run_command(command, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,21 +1,24 @@
-from pixel_font_knife import glyph_mapping_util
-from pixel_font_knife.kerning_util import KerningConfig
+import hashlib
+import os
+import pickle
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
 from tools.configs import path_define, options
-from tools.configs.font import FontConfig
 
-version = '2026.01.01'
+if TYPE_CHECKING:
+    from pixel_font_knife.glyph_mapping_util import SourceFlavorGroup
+    from pixel_font_knife.kerning_util import KerningConfig
 
-font_configs = {font_size: FontConfig.load(font_size) for font_size in options.font_sizes}
+    from tools.configs.font import FontConfig
 
-mappings = [
-    glyph_mapping_util.load_mapping(path_define.mappings_dir.joinpath('2700-27BF Dingbats.yml')),
-    glyph_mapping_util.load_mapping(path_define.mappings_dir.joinpath('2E80-2EFF CJK Radicals Supplement.yml')),
-    glyph_mapping_util.load_mapping(path_define.mappings_dir.joinpath('2F00-2FDF Kangxi Radicals.yml')),
-    glyph_mapping_util.load_mapping(path_define.mappings_dir.joinpath('1F100-1F1FF Enclosed Alphanumeric Supplement.yml')),
-]
+    font_configs: dict[options.FontSize, FontConfig]
+    mappings: list[dict[int, SourceFlavorGroup]]
+    kerning_config: KerningConfig
 
-kerning_config = KerningConfig.load(path_define.kernings_dir.joinpath('default.yml'))
+version = '2026.01.01'
 
 locale_to_language_flavor = {
     'en': 'latin',
@@ -26,3 +29,75 @@ locale_to_language_flavor = {
     'ja': 'ja',
     'ko': 'ko',
 }
+
+_COMPILED_CACHE_VERSION = 1
+
+_mapping_file_paths = [
+    path_define.mappings_dir.joinpath('2700-27BF Dingbats.yml'),
+    path_define.mappings_dir.joinpath('2E80-2EFF CJK Radicals Supplement.yml'),
+    path_define.mappings_dir.joinpath('2F00-2FDF Kangxi Radicals.yml'),
+    path_define.mappings_dir.joinpath('1F100-1F1FF Enclosed Alphanumeric Supplement.yml'),
+]
+
+_kerning_config_file_path = path_define.kernings_dir.joinpath('default.yml')
+
+
+def _load_compiled[T](name: str, source_file_paths: list[Path], load: Callable[[], T]) -> T:
+    hasher = hashlib.sha256(f'{_COMPILED_CACHE_VERSION}'.encode())
+    for file_path in [path_define.project_root_dir.joinpath('uv.lock'), *source_file_paths]:
+        hasher.update(file_path.name.encode('utf-8'))
+        hasher.update(hashlib.sha256(file_path.read_bytes()).digest())
+    digest = hasher.hexdigest()
+
+    cache_file_path = path_define.cache_dir.joinpath('configs', f'{name}.pickle')
+    if cache_file_path.is_file():
+        try:
+            cache_digest, value = pickle.loads(cache_file_path.read_bytes())
+            if cache_digest == digest:
+                return value
+        except Exception:
+            pass
+
+    value = load()
+    cache_file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_file_path = cache_file_path.with_name(f'{cache_file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        temp_file_path.write_bytes(pickle.dumps((digest, value), pickle.HIGHEST_PROTOCOL))
+        os.replace(temp_file_path, cache_file_path)
+    finally:
+        temp_file_path.unlink(missing_ok=True)
+    return value
+
+
+def _load_font_configs() -> dict[options.FontSize, FontConfig]:
+    from tools.configs.font import FontConfig
+    return {font_size: FontConfig.load(font_size) for font_size in options.font_sizes}
+
+
+def _load_mappings() -> list[dict[int, SourceFlavorGroup]]:
+    from pixel_font_knife import glyph_mapping_util
+    return [glyph_mapping_util.load_mapping(file_path) for file_path in _mapping_file_paths]
+
+
+def _load_kerning_config() -> KerningConfig:
+    from pixel_font_knife.kerning_util import KerningConfig
+    return KerningConfig.load(_kerning_config_file_path)
+
+
+def __getattr__(name: str) -> Any:
+    match name:
+        case 'font_configs':
+            value = _load_compiled(name, [Path(__file__).parent.joinpath('font.py'), *(path_define.configs_dir.joinpath(f'font-{font_size}px.yml') for font_size in options.font_sizes)], _load_font_configs)
+        case 'mappings':
+            value = _load_compiled(name, _mapping_file_paths, _load_mappings)
+        case 'kerning_config':
+            value = _load_compiled(name, [_kerning_config_file_path], _load_kerning_config)
+        case _:
+            raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def reload(*names: str):
+    for name in names:
+        globals().pop(name, None)
@@ -28,11 +28,26 @@ type FontFormat = Literal[
 ]
 font_formats = list[FontFormat](get_args(FontFormat.__value__))
 
+type FontCollectionFormat = Literal[
+    'otc',
+    'ttc',
+]
+font_collection_formats = list[FontCollectionFormat](get_args(FontCollectionFormat.__value__))
+
+type KerningMode = Literal[
+    'pair',
+    'class',
+]
+kerning_modes = list[KerningMode](get_args(KerningMode.__value__))
+
 type Attachment = Literal[
     'release',
     'info',
     'alphabet',
+    'kerning',
     'html',
+    'webfont',
+    'subset',
     'image',
 ]
 attachments = list[Attachment](get_args(Attachment.__value__))
@@ -13,5 +13,10 @@ images_dir = assets_dir.joinpath('images')
 build_dir = project_root_dir.joinpath('build')
 outputs_dir = build_dir.joinpath('outputs')
 releases_dir = build_dir.joinpath('releases')
+cache_dir = build_dir.joinpath('cache')
+archives_dir = build_dir.joinpath('archives')
+bench_dir = build_dir.joinpath('bench')
+reports_dir = build_dir.joinpath('reports')
+daemon_socket_file_path = build_dir.joinpath('daemon.sock')
 
 docs_dir = project_root_dir.joinpath('docs')
@@ -0,0 +1,18 @@
+from cyclopts import App, Parameter
+
+from tools import configs
+from tools.services import daemon_service
+
+app = App(
+    version=configs.version,
+    default_parameter=Parameter(consume_multiple=True),
+)
+
+
+@app.default
+def main():
+    daemon_service.serve()
+
+
+if __name__ == '__main__':
+    app()
@@ -1,13 +1,35 @@
+from pathlib import Path
+
+from cyclopts import App, Parameter
+
+from tools import configs
 from tools.configs import options
-from tools.services import format_service
+from tools.services import change_service, format_service
+
+app = App(
+    version=configs.version,
+    default_parameter=Parameter(consume_multiple=True),
+)
 
 
-def main():
+@app.default
+def main(
+        changed_since: str | None = None,
+        files: list[Path] | None = None,
+        check: bool = False,
+):
+    changed_file_paths = change_service.get_changed_file_paths(changed_since, files)
+
+    formatted_file_paths = []
     for font_size in options.font_sizes:
-        format_service.format_glyphs(font_size)
+        code_points = change_service.get_glyph_code_points(changed_file_paths, font_size)
+        formatted_file_paths.extend(format_service.format_glyphs(font_size, code_points, check))
+
+    formatted_file_paths.extend(format_service.format_mappings(change_service.get_mapping_file_paths(changed_file_paths), check))
 
-    format_service.format_mappings()
+    if check and len(formatted_file_paths) > 0:
+        raise SystemExit(1)
 
 
 if __name__ == '__main__':
-    main()
+    app()
@@ -0,0 +1,88 @@
+import subprocess
+from pathlib import Path
+
+from pixel_font_knife.glyph_file_util import GlyphFile
+
+from tools import configs
+from tools.configs import path_define
+from tools.configs.options import FontSize
+
+_tools_dir = path_define.project_root_dir.joinpath('tools')
+
+
+def get_changed_file_paths(changed_since: str | None = None, file_paths: list[Path] | None = None) -> set[Path] | None:
+    if changed_since is None and file_paths is None:
+        return None
+
+    changed_file_paths = set()
+    if changed_since is not None:
+        for args in (
+                ['diff', '--name-only', '--no-renames', '--relative', '-z', changed_since, '--'],
+                ['ls-files', '--others', '--exclude-standard', '-z'],
+        ):
+            output = subprocess.run(
+                ['git', *args],
+                cwd=path_define.project_root_dir,
+                check=True,
+                capture_output=True,
+            ).stdout.decode('utf-8')
+            changed_file_paths.update(path_define.project_root_dir.joinpath(file_name) for file_name in output.split('\0') if file_name != '')
+    if file_paths is not None:
+        changed_file_paths.update(file_path.resolve() for file_path in file_paths)
+    return changed_file_paths
+
+
+def is_tools_changed(changed_file_paths: set[Path] | None) -> bool:
+    if changed_file_paths is None:
+        return True
+    return any(file_path.is_relative_to(_tools_dir) for file_path in changed_file_paths)
+
+
+def get_glyph_code_points(changed_file_paths: set[Path] | None, font_size: FontSize) -> set[int] | None:
+    if changed_file_paths is None:
+        return None
+
+    font_config_file_path = path_define.configs_dir.joinpath(f'font-{font_size}px.yml')
+    glyphs_dir = path_define.glyphs_dir.joinpath(font_size)
+    code_points = set()
+    for file_path in changed_file_paths:
+        if file_path == font_config_file_path or file_path.is_relative_to(_tools_dir):
+            return None
+        if file_path.is_relative_to(glyphs_dir) and file_path.suffix == '.png':
+            code_points.add(GlyphFile.load(file_path).code_point)
+    return code_points
+
+
+def get_mapping_file_paths(changed_file_paths: set[Path] | None) -> list[Path]:
+    file_paths = sorted(file_path for file_path in path_define.mappings_dir.iterdir() if file_path.suffix == '.yml')
+    if changed_file_paths is None:
+        return file_paths
+    return [file_path for file_path in file_paths if file_path in changed_file_paths]
+
+
+def get_mapping_dependents(changed_file_paths: set[Path], code_points: set[int]) -> set[int]:
+    from pixel_font_knife import glyph_mapping_util
+
+    dependents = set(code_points)
+    for file_path in get_mapping_file_paths(changed_file_paths):
+        dependents.update(glyph_mapping_util.load_mapping(file_path))
+
+    while True:
+        count = len(dependents)
+        for mapping in configs.mappings:
+            for code_point, source_group in mapping.items():
+                if any(source_glyph.code_point in dependents for source_glyph in source_group.values()):
+                    dependents.add(code_point)
+        if len(dependents) == count:
+            return dependents
+
+
+def get_mapping_sources(code_points: set[int]) -> set[int]:
+    sources = set(code_points)
+    while True:
+        count = len(sources)
+        for mapping in configs.mappings:
+            for code_point in sources & mapping.keys():
+                sources.update(source_glyph.code_point for source_glyph in mapping[code_point].values())
+        if len(sources) == count:
+            return sources
@@ -1,67 +1,164 @@
+import functools
+import json
+import operator
+import subprocess
+import sys
+from pathlib import Path
+
 import unicodedata2
 import unidata_blocks
-from pixel_font_knife import glyph_file_util, glyph_mapping_util
+from pixel_font_knife import glyph_mapping_util
+from pixel_font_knife.glyph_file_util import GlyphFile
 
 from tools import configs
 from tools.configs import path_define
 from tools.configs.options import FontSize
+from tools.services import change_service, glyph_service
+
+_BORDER_FREE_BLOCK_NAMES = {
+    'Box Drawing',
+    'Block Elements',
+    'Halfwidth and Fullwidth Forms',
+}
+
+_BORDER_FREE_CODE_POINTS = {
+    0x2013,
+    0x2015,
+    0x25EF,
+    0x3030,
+    0x3035,
+}
+
+_CLI_LAZY_MODULE_NAMES = (
+    'PIL',
+    'bs4',
+    'jinja2',
+    'unicodedata2',
+    'unidata_blocks',
+    'character_encoding_utils',
+    'yaml',
+    'fontTools',
+    'pixel_font_builder',
+    'pixel_font_knife',
+)
+
+
+class CheckViolation:
+    rule: str
+    message: str
+    file_paths: list[Path]
+
+    def __init__(self, rule: str, message: str, file_paths: list[Path] | None = None):
+        self.rule = rule
+        self.message = message
+        self.file_paths = [] if file_paths is None else file_paths
+
+    def to_text(self) -> str:
+        lines = [f'{self.rule}: {self.message}']
+        for file_path in self.file_paths:
+            lines.append(f"    '{file_path}'")
+        return '\n'.join(lines)
+
+    def to_json(self) -> dict[str, object]:
+        return {
+            'rule': self.rule,
+            'message': self.message,
+            'file_paths': [str(file_path) for file_path in self.file_paths],
+        }
+
 
+def _pack_rows(glyph_file: GlyphFile) -> tuple[int, ...]:
+    return tuple(int(''.join(map(str, bitmap_row)) or '0', 2) for bitmap_row in glyph_file.bitmap)
 
-def check_glyphs(font_size: FontSize):
+
+def check_glyphs(font_size: FontSize, code_points: set[int] | None = None) -> list[CheckViolation]:
     font_config = configs.font_configs[font_size]
     font_size_x = font_config.font_size_x
     font_size_y = font_config.font_size_y
     canvas_size = font_config.canvas_size
+    half_font_size_x = font_size_x // 2
+
+    load_code_points = None if code_points is None else change_service.get_mapping_sources(code_points)
 
-    for width_mode_dir_name in ('common', 'proportional'):
-        context = glyph_file_util.load_context(path_define.glyphs_dir.joinpath(font_size, width_mode_dir_name))
+    violations = []
+    for width_mode_dir_name, context in glyph_service.load_contexts(font_size, code_points=load_code_points).items():
         for mapping in configs.mappings:
             glyph_mapping_util.apply_mapping(context, mapping)
 
         for code_point, flavor_group in sorted(context.items()):
-            assert None in flavor_group, f'[{font_size}px] missing default flavor: {width_mode_dir_name} {code_point:04X}'
+            if code_points is not None and code_point not in code_points:
+                continue
+
+            if None not in flavor_group:
+                violations.append(CheckViolation('missing-default-flavor', f'[{font_size}px] {width_mode_dir_name} {code_point:04X}', [glyph_file.file_path for glyph_file in flavor_group.values()]))
 
             if code_point == -1:
-                block = None
-                east_asian_width = 'F'
+                border_free = True
+                allowed_widths = (font_size_x,)
             else:
                 block = unidata_blocks.get_block_by_code_point(code_point)
-                east_asian_width = unicodedata2.east_asian_width(chr(code_point))
+                border_free = block is None or block.name in _BORDER_FREE_BLOCK_NAMES or code_point in _BORDER_FREE_CODE_POINTS
+                match unicodedata2.east_asian_width(chr(code_point)):
+                    # H/Halfwidth or Na/Narrow
+                    case 'H' | 'Na':
+                        allowed_widths = (half_font_size_x,)
+                    # F/Fullwidth or W/Wide
+                    case 'F' | 'W':
+                        allowed_widths = (font_size_x,)
+                    # A/Ambiguous or N/Neutral
+                    case _:
+                        allowed_widths = (half_font_size_x, font_size_x)
 
-            bitmap_strings = {}
-            for glyph_file in set(flavor_group.values()):
-                bitmap_string = str(glyph_file.bitmap)
-                assert bitmap_string not in bitmap_strings, f"[{font_size}px] duplicate glyph bitmaps:\n'{glyph_file.file_path}'\n'{bitmap_strings[bitmap_string].file_path}'"
-                bitmap_strings[bitmap_string] = glyph_file
+            packed_glyph_files = {}
+            for glyph_file in sorted(set(flavor_group.values()), key=lambda x: x.file_path):
+                rows = _pack_rows(glyph_file)
+                key = glyph_file.width, rows
+                if key in packed_glyph_files:
+                    violations.append(CheckViolation('duplicate-bitmap', f'[{font_size}px] {code_point:04X}', [glyph_file.file_path, packed_glyph_files[key].file_path]))
+                else:
+                    packed_glyph_files[key] = glyph_file
 
                 if width_mode_dir_name == 'common':
-                    assert glyph_file.height in (font_size_x, font_size_y, font_size_x * 2), f"[{font_size}px] glyph bitmap size error: '{glyph_file.file_path}'"
-
-                    match east_asian_width:
-                        # H/Halfwidth or Na/Narrow
-                        case 'H' | 'Na':
-                            assert glyph_file.width == font_size_x / 2, f"[{font_size}px] glyph bitmap size error: '{glyph_file.file_path}'"
-                        # F/Fullwidth or W/Wide
-                        case 'F' | 'W':
-                            assert glyph_file.width == font_size_x, f"[{font_size}px] glyph bitmap size error: '{glyph_file.file_path}'"
-                        # A/Ambiguous or N/Neutral
-                        case _:
-                            assert glyph_file.width in (font_size_x / 2, font_size_x), f"[{font_size}px] glyph bitmap size error: '{glyph_file.file_path}'"
-
-                    if block is not None:
-                        if block.name not in (
-                                'Box Drawing',
-                                'Block Elements',
-                                'Halfwidth and Fullwidth Forms',
-                        ) and code_point not in (
-                                0x2013,
-                                0x2015,
-                                0x25EF,
-                                0x3030,
-                                0x3035,
-                        ):
-                            assert all(color == 0 for color in glyph_file.bitmap[0]), f"[{font_size}px] glyph bitmap size error: '{glyph_file.file_path}'"
-                            assert all(glyph_file.bitmap[i][-1] == 0 for i in range(0, len(glyph_file.bitmap))), f"[{font_size}px] glyph bitmap size error: '{glyph_file.file_path}'"
+                    if glyph_file.height not in (font_size_x, font_size_y, font_size_x * 2):
+                        violations.append(CheckViolation('bitmap-height', f'[{font_size}px] {code_point:04X} height {glyph_file.height} not in {(font_size_x, font_size_y, font_size_x * 2)}', [glyph_file.file_path]))
+                    if glyph_file.width not in allowed_widths:
+                        violations.append(CheckViolation('bitmap-width', f'[{font_size}px] {code_point:04X} width {glyph_file.width} not in {allowed_widths}', [glyph_file.file_path]))
+                    if not border_free and len(rows) > 0:
+                        if rows[0] != 0:
+                            violations.append(CheckViolation('top-border', f'[{font_size}px] {code_point:04X} top row must be empty', [glyph_file.file_path]))
+                        if functools.reduce(operator.or_, rows) & 1 != 0:
+                            violations.append(CheckViolation('right-border', f'[{font_size}px] {code_point:04X} right column must be empty', [glyph_file.file_path]))
 
                 if width_mode_dir_name == 'proportional':
-                    assert glyph_file.height == canvas_size, f"[{font_size}px] glyph bitmap size error: '{glyph_file.file_path}'"
+                    if glyph_file.height != canvas_size:
+                        violations.append(CheckViolation('bitmap-height', f'[{font_size}px] {code_point:04X} height {glyph_file.height} != {canvas_size}', [glyph_file.file_path]))
+    return violations
+
+
+def check_cli_imports() -> list[CheckViolation]:
+    output = subprocess.run(
+        [sys.executable, '-c', 'import sys, tools.cli; print(*sys.modules)'],
+        cwd=path_define.project_root_dir,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    module_names = {module_name.split('.')[0] for module_name in output.split()}
+    violations = []
+    for module_name in _CLI_LAZY_MODULE_NAMES:
+        if module_name in module_names:
+            violations.append(CheckViolation('eager-import', f"'{module_name}' is imported eagerly by 'tools.cli'"))
+    return violations
+
+
+def format_report_text(violations: list[CheckViolation]) -> str:
+    lines = [violation.to_text() for violation in violations]
+    lines.append(f'{len(violations)} violation(s)')
+    return '\n'.join(lines)
+
+
+def format_report_json(violations: list[CheckViolation]) -> str:
+    return json.dumps({
+        'count': len(violations),
+        'violations': [violation.to_json() for violation in violations],
+    }, ensure_ascii=False, indent=2)
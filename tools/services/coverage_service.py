@@ -0,0 +1,135 @@
+import bisect
+import functools
+import os
+import pickle
+import threading
+from collections import defaultdict
+from importlib import metadata
+
+import unicodedata2
+import unidata_blocks
+from character_encoding_utils import gb2312, big5, shiftjis, ksx1001
+from loguru import logger
+
+from tools.configs import path_define
+
+_CACHE_VERSION = 2
+
+_charsets = {
+    'gb2312': gb2312,
+    'big5': big5,
+    'shiftjis': shiftjis,
+    'ksx1001': ksx1001,
+}
+
+
+def is_glyph_required(c: str) -> bool:
+    if c in ('\u0020', '\u3000'):
+        return True
+    category = unicodedata2.category(c)
+    return category.startswith(('L', 'M', 'N', 'P', 'S'))
+
+
+class CoverageIndex:
+    @staticmethod
+    def build() -> CoverageIndex:
+        block_starts = []
+        block_ends = []
+        block_totals = {}
+        unrequired_code_points = set()
+        for block in unidata_blocks.get_blocks():
+            block_starts.append(block.code_start)
+            block_ends.append(block.code_end)
+            if 'Private Use Area' in block.name:
+                block_totals[block.code_start] = 0
+            else:
+                total = 0
+                for code_point in range(block.code_start, block.code_end + 1):
+                    if is_glyph_required(chr(code_point)):
+                        total += 1
+                    else:
+                        unrequired_code_points.add(code_point)
+                block_totals[block.code_start] = total
+
+        charset_categories = {}
+        for charset_name, charset in _charsets.items():
+            categories = defaultdict(set)
+            for code_point in range(0x10000):
+                category = charset.query_category(chr(code_point))
+                if category is not None:
+                    categories[category].add(code_point)
+            charset_categories[charset_name] = {category: frozenset(categories[category]) for category in charset.get_categories()}
+
+        return CoverageIndex(block_starts, block_ends, block_totals, frozenset(unrequired_code_points), charset_categories)
+
+    @staticmethod
+    def load() -> CoverageIndex:
+        version = _CACHE_VERSION, unidata_blocks.unicode_version, unicodedata2.unidata_version, metadata.version('character-encoding-utils')
+        cache_file_path = path_define.cache_dir.joinpath('coverage.bin')
+        if cache_file_path.is_file():
+            try:
+                data = pickle.loads(cache_file_path.read_bytes())
+                if data['version'] == version:
+                    return data['index']
+            except Exception as e:
+                logger.warning("Discard broken coverage index: '{}' ({})", cache_file_path, e)
+
+        index = CoverageIndex.build()
+        cache_file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file_path = cache_file_path.with_name(f'{cache_file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            temp_file_path.write_bytes(pickle.dumps({
+                'version': version,
+                'index': index,
+            }, pickle.HIGHEST_PROTOCOL))
+            os.replace(temp_file_path, cache_file_path)
+        finally:
+            temp_file_path.unlink(missing_ok=True)
+        logger.info("Make coverage index: '{}'", cache_file_path)
+        return index
+
+    block_starts: list[int]
+    block_ends: list[int]
+    block_totals: dict[int, int]
+    unrequired_code_points: frozenset[int]
+    charset_categories: dict[str, dict[str, frozenset[int]]]
+
+    def __init__(
+            self,
+            block_starts: list[int],
+            block_ends: list[int],
+            block_totals: dict[int, int],
+            unrequired_code_points: frozenset[int],
+            charset_categories: dict[str, dict[str, frozenset[int]]],
+    ):
+        self.block_starts = block_starts
+        self.block_ends = block_ends
+        self.block_totals = block_totals
+        self.unrequired_code_points = unrequired_code_points
+        self.charset_categories = charset_categories
+
+    def get_block_start(self, code_point: int) -> int:
+        index = bisect.bisect_right(self.block_starts, code_point) - 1
+        assert index >= 0 and code_point <= self.block_ends[index], f'code point not in any block: {code_point:04X}'
+        return self.block_starts[index]
+
+    def count_blocks(self, code_points: set[int]) -> dict[int, int]:
+        counts = defaultdict(int)
+        for code_point in code_points:
+            counts[self.get_block_start(code_point)] += 1
+        return dict(sorted(counts.items()))
+
+    def count_charset(self, charset_name: str, code_points: set[int]) -> dict[str, int]:
+        counts = {category: len(code_points & category_code_points) for category, category_code_points in self.charset_categories[charset_name].items()}
+        counts['total'] = sum(counts.values())
+        return counts
+
+    def get_charset_total(self, charset_name: str, category: str | None = None) -> int:
+        if category is None:
+            return sum(len(category_code_points) for category_code_points in self.charset_categories[charset_name].values())
+        return len(self.charset_categories[charset_name][category])
+
+
+@functools.cache
+def get_coverage_index() -> CoverageIndex:
+    return CoverageIndex.load()
@@ -0,0 +1,189 @@
+import importlib
+import json
+import os
+import socket
+import time
+import traceback
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from loguru import logger
+
+from tools.configs import path_define
+from tools.services import font_service, watch_service
+
+_tools_dir = path_define.project_root_dir.joinpath('tools')
+
+_snapshot_dirs = [
+    *watch_service.watch_dirs,
+    _tools_dir,
+]
+
+
+def get_command_args(command: str, args: list[str]) -> tuple[str, list[str]]:
+    match command:
+        case 'build':
+            return 'tools.cli', args
+        case 'check':
+            return 'tools.check', args
+        case 'format':
+            return 'tools.format', args
+        case 'info':
+            return 'tools.cli', ['--font-formats', '--attachments', 'info', 'alphabet', *(['--font-sizes', *args] if len(args) > 0 else [])]
+        case _:
+            raise ValueError(f'unknown command: {repr(command)}')
+
+
+def run_command(command: str, args: list[str]) -> int:
+    module_name, args = get_command_args(command, args)
+    try:
+        importlib.import_module(module_name).app(args)
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        return e.code if isinstance(e.code, int) else 1
+    return 0
+
+
+class _Connection:
+    connection: socket.socket
+    closed: bool
+
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+        self.closed = False
+
+    def send(self, message: dict[str, object]):
+        if self.closed:
+            return
+        try:
+            self.connection.sendall(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+        except OSError:
+            self.closed = True
+
+
+class _StreamWriter:
+    connection: _Connection
+    stream: str
+
+    def __init__(self, connection: _Connection, stream: str):
+        self.connection = connection
+        self.stream = stream
+
+    def write(self, text: str) -> int:
+        if len(text) > 0:
+            self.connection.send({'stream': self.stream, 'text': text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class Daemon:
+    start_time: float
+    request_count: int
+    snapshot: watch_service.Snapshot
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.request_count = 0
+        self.snapshot = watch_service.take_snapshot(_snapshot_dirs)
+
+    def _refresh(self) -> set[Path]:
+        snapshot = watch_service.take_snapshot(_snapshot_dirs)
+        changed_file_paths = watch_service.get_changed_file_paths(self.snapshot, snapshot)
+        self.snapshot = snapshot
+        return changed_file_paths
+
+    def _get_status(self) -> dict[str, object]:
+        return {
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.start_time, 3),
+            'requests': self.request_count,
+            'design_contexts': [f'{design_context.font_size}px-{design_context.kerning_mode}' for design_context in font_service.get_pooled_design_contexts()],
+        }
+
+    def handle(self, connection: _Connection, command: str, args: list[str]) -> bool:
+        changed_file_paths = self._refresh()
+        if any(file_path.is_relative_to(_tools_dir) for file_path in changed_file_paths):
+            logger.warning('Tools changed, stop daemon')
+            connection.send({'unavailable': 'tools changed, daemon stopped'})
+            return False
+        if len(changed_file_paths) > 0:
+            font_service.reload_design_context_pool(changed_file_paths)
+
+        self.request_count += 1
+        match command:
+            case 'status':
+                connection.send({'stream': 'stdout', 'text': json.dumps(self._get_status(), indent=2) + '\n'})
+                connection.send({'exit_code': 0})
+                return True
+            case 'stop':
+                connection.send({'exit_code': 0})
+                return False
+            case 'build' if '--watch' in args:
+                connection.send({'stream': 'stderr', 'text': "'--watch' is not supported by daemon\n"})
+                connection.send({'exit_code': 2})
+                return True
+
+        start_time = time.perf_counter()
+        handler_id = logger.add(_StreamWriter(connection, 'stderr'), colorize=False)
+        try:
+            with redirect_stdout(_StreamWriter(connection, 'stdout')):
+                exit_code = run_command(command, args)
+        except Exception:
+            connection.send({'stream': 'stderr', 'text': traceback.format_exc()})
+            exit_code = 1
+        finally:
+            logger.remove(handler_id)
+        logger.info('Handle request: {} {} -> {} ({:.3f}s)', command, args, exit_code, time.perf_counter() - start_time)
+        connection.send({'exit_code': exit_code})
+        return True
+
+
+def is_running() -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(path_define.daemon_socket_file_path))
+        return True
+    except OSError:
+        return False
+
+
+def serve():
+    socket_file_path = path_define.daemon_socket_file_path
+    if socket_file_path.exists():
+        if is_running():
+            raise RuntimeError(f"daemon already running: '{socket_file_path}'")
+        socket_file_path.unlink()
+    socket_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    font_service.enable_design_context_pool()
+    daemon = Daemon()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(socket_file_path))
+        server.listen()
+        logger.info("Daemon listening: '{}'", socket_file_path)
+        try:
+            running = True
+            while running:
+                connection, _ = server.accept()
+                with connection:
+                    try:
+                        with connection.makefile('r', encoding='utf-8') as file:
+                            line = file.readline()
+                        if line == '':
+                            continue
+                        request = json.loads(line)
+                        command, args = request['command'], request.get('args', [])
+                        if not isinstance(command, str) or not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+                            raise TypeError(f'malformed request: {line.strip()!r}')
+                        running = daemon.handle(_Connection(connection), command, args)
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.warning('Reject request: {!r}', e)
+                        _Connection(connection).send({'exit_code': 2, 'error': repr(e)})
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket_file_path.unlink(missing_ok=True)
+    logger.info('Daemon stopped')
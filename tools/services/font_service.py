@@ -1,43 +1,89 @@
 import math
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
+from fontTools.ttLib import TTFont
 from loguru import logger
-from pixel_font_builder import FontBuilder, WeightName, SerifStyle, SlantStyle, WidthStyle, Glyph, opentype
-from pixel_font_knife import glyph_file_util, glyph_mapping_util, kerning_util
-from pixel_font_knife.glyph_file_util import GlyphFlavorGroup
+from pixel_font_builder import FontBuilder, FontCollectionBuilder, WeightName, SerifStyle, SlantStyle, WidthStyle, Glyph, opentype
+from pixel_font_knife import glyph_file_util, glyph_mapping_util
+from pixel_font_knife.glyph_file_util import GlyphFile, GlyphFlavorGroup
 
 from tools import configs
 from tools.configs import path_define, options
-from tools.configs.options import FontSize, LanguageFlavor, FontFormat
+from tools.configs.options import FontSize, LanguageFlavor, FontFormat, FontCollectionFormat, KerningMode
+from tools.services import change_service, glyph_service, kerning_service, manifest_service, trace_service
+from tools.services.kerning_service import KerningClasses
+from tools.services.manifest_service import BuildManifest
+
+if TYPE_CHECKING:
+    from tools.services.image_service import BitmapFont
+
+
+class SharedOutlinesPainter(opentype.SolidOutlinesPainter):
+    _outlines: dict[tuple[tuple[int, ...], ...], list[list[tuple[int, int]]]]
+
+    def __init__(self):
+        self._outlines = {}
+
+    def _create_outlines(self, bitmap: list[list[int]]) -> list[list[tuple[int, int]]]:
+        key = tuple(tuple(bitmap_row) for bitmap_row in bitmap)
+        outlines = self._outlines.get(key)
+        if outlines is None:
+            outlines = super()._create_outlines(bitmap)
+            self._outlines[key] = outlines
+        return outlines
 
 
 class DesignContext:
     @staticmethod
-    def load(font_size: FontSize) -> DesignContext:
+    @trace_service.traced
+    def load(font_size: FontSize, use_cache: bool = True, use_archive: bool = False, kerning_mode: KerningMode = 'pair') -> DesignContext:
         glyph_files = {}
-        for width_mode_dir_name in ('common', 'proportional'):
-            context = glyph_file_util.load_context(path_define.glyphs_dir.joinpath(font_size, width_mode_dir_name))
+        if use_archive:
+            contexts = glyph_service.load_archive_contexts(font_size)
+        else:
+            contexts = glyph_service.load_contexts(font_size, use_cache)
+        for context in contexts.values():
             glyph_files.update(context)
 
         for mapping in configs.mappings:
             glyph_mapping_util.apply_mapping(glyph_files, mapping)
 
-        return DesignContext(font_size, glyph_files)
+        return DesignContext(font_size, glyph_files, kerning_mode)
 
     font_size: FontSize
+    kerning_mode: KerningMode
     _glyph_files: dict[int, GlyphFlavorGroup]
     _alphabet: set[str] | None
     _kerning_values: dict[tuple[str, str], int] | None
+    _kerning_classes: KerningClasses | None
+    _glyph_table: dict[GlyphFile, Glyph] | None
+    _outlines_painter: SharedOutlinesPainter
+    _bitmap_fonts: dict[tuple[LanguageFlavor, int], BitmapFont]
 
     def __init__(
             self,
             font_size: FontSize,
             glyph_files: dict[int, GlyphFlavorGroup],
+            kerning_mode: KerningMode = 'pair',
     ):
         self.font_size = font_size
+        self.kerning_mode = kerning_mode
         self._glyph_files = glyph_files
         self._alphabet = None
         self._kerning_values = None
+        self._kerning_classes = None
+        self._glyph_table = None
+        self._outlines_painter = SharedOutlinesPainter()
+        self._bitmap_fonts = {}
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = vars(self).copy()
+        state['_bitmap_fonts'] = {}
+        return state
 
     @property
     def alphabet(self) -> set[str]:
@@ -48,10 +94,102 @@ class DesignContext:
     @property
     def kerning_values(self) -> dict[tuple[str, str], int]:
         if self._kerning_values is None:
-            self._kerning_values = kerning_util.calculate_kerning_values(configs.kerning_config, self._glyph_files)
+            self._kerning_values = kerning_service.calculate_kerning_values(self.font_size, self._glyph_files)
         return self._kerning_values
 
-    def _create_builder(self, language_flavor: LanguageFlavor) -> FontBuilder:
+    @property
+    def kerning_classes(self) -> KerningClasses:
+        if self._kerning_classes is None:
+            self._kerning_classes = kerning_service.create_kerning_classes(self.kerning_values)
+        return self._kerning_classes
+
+    @property
+    def glyph_table(self) -> dict[GlyphFile, Glyph]:
+        if self._glyph_table is None:
+            font_config = configs.font_configs[self.font_size]
+            glyph_table = {}
+            for flavor_group in self._glyph_files.values():
+                for glyph_file in flavor_group.values():
+                    if glyph_file in glyph_table:
+                        continue
+                    horizontal_offset_x = 0
+                    horizontal_offset_y = font_config.baseline - font_config.font_size_y - (glyph_file.height - font_config.font_size_y) // 2
+                    vertical_offset_x = -math.ceil(glyph_file.width / 2)
+                    vertical_offset_y = (font_config.font_size_y - glyph_file.height) // 2 - 1
+                    glyph_table[glyph_file] = Glyph(
+                        name=glyph_file.glyph_name,
+                        horizontal_offset=(horizontal_offset_x, horizontal_offset_y),
+                        advance_width=glyph_file.width,
+                        vertical_offset=(vertical_offset_x, vertical_offset_y),
+                        advance_height=font_config.font_size_y,
+                        bitmap=glyph_file.bitmap.data,
+                    )
+            self._glyph_table = glyph_table
+        return self._glyph_table
+
+    @trace_service.traced
+    def reload(self, code_points: set[int] | None = None, use_cache: bool = True) -> list[LanguageFlavor]:
+        old_glyph_files = self._glyph_files
+        old_kerning_values = self.kerning_values
+
+        if code_points is None:
+            glyph_files = DesignContext.load(self.font_size, use_cache)._glyph_files
+            code_points = old_glyph_files.keys() | glyph_files.keys()
+        else:
+            context = {}
+            for width_mode_context in glyph_service.load_contexts(self.font_size, use_cache, change_service.get_mapping_sources(code_points)).values():
+                context.update(width_mode_context)
+            for mapping in configs.mappings:
+                glyph_mapping_util.apply_mapping(context, mapping)
+            glyph_files = dict(old_glyph_files)
+            for code_point in code_points:
+                if code_point in context:
+                    glyph_files[code_point] = context[code_point]
+                else:
+                    glyph_files.pop(code_point, None)
+            glyph_files = dict(sorted(glyph_files.items()))
+
+        self._glyph_files = glyph_files
+        self._alphabet = None
+        self._kerning_values = None
+        self._kerning_classes = None
+        self._glyph_table = None
+        self._outlines_painter = SharedOutlinesPainter()
+        self._bitmap_fonts = {}
+
+        if self.kerning_values != old_kerning_values:
+            return list(options.language_flavors)
+
+        glyph_keys = {}
+        language_flavors = []
+        for language_flavor in options.language_flavors:
+            for code_point in code_points:
+                old_flavor_group = old_glyph_files.get(code_point)
+                flavor_group = glyph_files.get(code_point)
+                old_glyph_key = None if old_flavor_group is None else _get_glyph_key(glyph_keys, old_flavor_group.get_file(language_flavor))
+                glyph_key = None if flavor_group is None else _get_glyph_key(glyph_keys, flavor_group.get_file(language_flavor))
+                if glyph_key != old_glyph_key:
+                    language_flavors.append(language_flavor)
+                    break
+        return language_flavors
+
+    def get_bitmap_font(self, language_flavor: LanguageFlavor, scale: int = 1) -> BitmapFont:
+        from tools.services.image_service import BitmapFont
+
+        # Keyed by flavor and scale only, so the cache stays bounded; reload() drops it.
+        bitmap_font = self._bitmap_fonts.get((language_flavor, scale))
+        if bitmap_font is None:
+            bitmap_font = BitmapFont(self, language_flavor, scale)
+            self._bitmap_fonts[(language_flavor, scale)] = bitmap_font
+        return bitmap_font
+
+    def get_glyph_file(self, code_point: int, language_flavor: LanguageFlavor) -> GlyphFile:
+        flavor_group = self._glyph_files.get(code_point)
+        if flavor_group is None:
+            flavor_group = self._glyph_files[-1]
+        return flavor_group.get_file(language_flavor)
+
+    def _create_builder(self, language_flavor: LanguageFlavor, glyph_sequence: list[GlyphFile] | None = None) -> FontBuilder:
         font_config = configs.font_configs[self.font_size]
 
         builder = FontBuilder()
@@ -84,53 +222,285 @@ class DesignContext:
         builder.meta_info.designer_url = 'https://takwolf.com'
         builder.meta_info.license_url = 'https://github.com/TakWolf/capsule-pixel-font/blob/master/LICENSE-OFL'
 
-        glyph_sequence = glyph_file_util.get_glyph_sequence(self._glyph_files, [language_flavor])
-        for glyph_file in glyph_sequence:
-            horizontal_offset_x = 0
-            horizontal_offset_y = font_config.baseline - font_config.font_size_y - (glyph_file.height - font_config.font_size_y) // 2
-            vertical_offset_x = -math.ceil(glyph_file.width / 2)
-            vertical_offset_y = (font_config.font_size_y - glyph_file.height) // 2 - 1
-            builder.glyphs.append(Glyph(
-                name=glyph_file.glyph_name,
-                horizontal_offset=(horizontal_offset_x, horizontal_offset_y),
-                advance_width=glyph_file.width,
-                vertical_offset=(vertical_offset_x, vertical_offset_y),
-                advance_height=font_config.font_size_y,
-                bitmap=glyph_file.bitmap.data,
-            ))
+        glyph_table = self.glyph_table
+        if glyph_sequence is None:
+            glyph_sequence = glyph_file_util.get_glyph_sequence(self._glyph_files, [language_flavor])
+        builder.glyphs.extend(glyph_table[glyph_file] for glyph_file in glyph_sequence)
 
         character_mapping = glyph_file_util.get_character_mapping(self._glyph_files, language_flavor)
         builder.character_mapping.update(character_mapping)
 
-        builder.kerning_values.update(self.kerning_values)
+        if self.kerning_mode == 'class':
+            builder.opentype_config.feature_files.append(opentype.FeatureFile(kerning_service.build_kern_class_feature(self.kerning_classes, builder.opentype_config.px_to_units)))
+        else:
+            builder.kerning_values.update(self.kerning_values)
 
+        builder.opentype_config.outlines_painter = self._outlines_painter
         builder.opentype_config.fields_override.head_y_max = font_config.ascent
         builder.opentype_config.fields_override.head_y_min = font_config.descent
 
         return builder
 
-    def make_fonts(self, font_formats: list[FontFormat]):
+    def _create_collection_builder(self) -> FontCollectionBuilder:
+        glyph_sequence = glyph_file_util.get_glyph_sequence(self._glyph_files, options.language_flavors)
+        return FontCollectionBuilder(self._create_builder(language_flavor, glyph_sequence) for language_flavor in options.language_flavors)
+
+    def get_flavor_digest(self, language_flavor: LanguageFlavor) -> str:
+        glyphs = []
+        for glyph_file in glyph_file_util.get_glyph_sequence(self._glyph_files, [language_flavor]):
+            glyphs.append((glyph_file.glyph_name, glyph_file.width, glyph_file.height, bytes(color for bitmap_row in glyph_file.bitmap for color in bitmap_row)))
+        character_mapping = sorted(glyph_file_util.get_character_mapping(self._glyph_files, language_flavor).items())
+        return manifest_service.digest_values(
+            configs.version,
+            vars(configs.font_configs[self.font_size]),
+            glyphs,
+            character_mapping,
+            sorted(self.kerning_values.items()),
+            self.kerning_mode,
+        )
+
+    def _make_font_files(self, builder: FontBuilder, language_flavor: LanguageFlavor, font_formats: list[FontFormat]) -> list[Path]:
+        file_paths = []
+        sfnt_data = {}
+        for font_format in font_formats:
+            file_path = get_font_file_path(self.font_size, language_flavor, font_format)
+            with trace_service.span(f'font_service.save.{font_format}') as span:
+                match font_format:
+                    case 'bdf' | 'pcf':
+                        getattr(builder, f'save_{font_format}')(file_path)
+                    case _:
+                        outlines_format, _, flavor = font_format.partition('.')
+                        if outlines_format not in sfnt_data:
+                            sfnt_data[outlines_format] = _compile_sfnt(builder, outlines_format == 'ttf')
+                        if flavor == '':
+                            file_path.write_bytes(sfnt_data[outlines_format])
+                        else:
+                            _save_sfnt_with_flavor(sfnt_data[outlines_format], file_path, opentype.Flavor(flavor))
+                if span is not None:
+                    span.add_outputs(file_path)
+            file_paths.append(file_path)
+        return file_paths
+
+    def _make_font_collection_files(self, font_formats: list[FontCollectionFormat]) -> list[Path]:
+        collection_builder = self._create_collection_builder()
+        file_paths = []
+        for font_format in font_formats:
+            file_path = get_font_collection_file_path(self.font_size, font_format)
+            with trace_service.span(f'font_service.save.{font_format}') as span:
+                getattr(collection_builder, f'save_{font_format}')(file_path)
+                if span is not None:
+                    span.add_outputs(file_path)
+            file_paths.append(file_path)
+        return file_paths
+
+    @trace_service.traced
+    def make_fonts(self, font_formats: list[FontFormat | FontCollectionFormat], jobs: int = 1, manifest: BuildManifest | None = None, language_flavors: list[LanguageFlavor] | None = None):
         path_define.outputs_dir.mkdir(parents=True, exist_ok=True)
 
-        if len(font_formats) > 0:
-            for language_flavor in options.language_flavors:
+        if len(font_formats) == 0:
+            return
+
+        collection_font_formats = [font_format for font_format in font_formats if font_format in options.font_collection_formats]
+        font_formats = [font_format for font_format in font_formats if font_format not in options.font_collection_formats]
+
+        pending_font_formats = {}
+        flavor_digests = {}
+        for language_flavor in options.language_flavors:
+            if language_flavors is not None and language_flavor not in language_flavors:
+                continue
+            if manifest is None:
+                if len(font_formats) > 0:
+                    pending_font_formats[language_flavor] = font_formats
+                continue
+            flavor_digest = self.get_flavor_digest(language_flavor)
+            flavor_digests[language_flavor] = flavor_digest
+            for font_format in font_formats:
+                file_name = get_font_file_path(self.font_size, language_flavor, font_format).name
+                if manifest.is_up_to_date(file_name, flavor_digest):
+                    logger.info('Skip up-to-date: {}', file_name)
+                else:
+                    pending_font_formats.setdefault(language_flavor, []).append(font_format)
+
+        pending_collection_font_formats = []
+        collection_digest = None
+        if manifest is None:
+            pending_collection_font_formats = collection_font_formats
+        elif len(collection_font_formats) > 0:
+            collection_digest = manifest_service.digest_values(*(flavor_digests[language_flavor] if language_flavor in flavor_digests else self.get_flavor_digest(language_flavor) for language_flavor in options.language_flavors))
+            for font_format in collection_font_formats:
+                file_name = get_font_collection_file_path(self.font_size, font_format).name
+                if manifest.is_up_to_date(file_name, collection_digest):
+                    logger.info('Skip up-to-date: {}', file_name)
+                else:
+                    pending_collection_font_formats.append(font_format)
+
+        def on_font_made(digest: str | None, file_path: Path):
+            logger.info("Make font: '{}'", file_path)
+            if manifest is not None:
+                manifest.update(file_path.name, digest, [file_path])
+
+        if jobs > 1:
+            # Workers receive a pickled copy of this context, so compute shared state once up front.
+            _ = self.kerning_values
+            if self.kerning_mode == 'class':
+                _ = self.kerning_classes
+            _ = self.glyph_table
+            with ProcessPoolExecutor(jobs, initializer=_init_font_worker, initargs=(self,)) as executor:
+                futures = []
+                for font_format in pending_collection_font_formats:
+                    futures.append((collection_digest, executor.submit(_make_font_collection_worker, [font_format])))
+                for language_flavor, language_font_formats in pending_font_formats.items():
+                    for font_formats_group in _group_font_formats(language_font_formats):
+                        futures.append((flavor_digests.get(language_flavor), executor.submit(_make_font_worker, language_flavor, font_formats_group)))
+                try:
+                    for digest, future in futures:
+                        for file_path in future.result():
+                            on_font_made(digest, file_path)
+                except BaseException:
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        else:
+            for language_flavor, language_font_formats in pending_font_formats.items():
                 builder = self._create_builder(language_flavor)
-                for font_format in font_formats:
-                    file_path = path_define.outputs_dir.joinpath(f'capsule-pixel-{self.font_size}px-{language_flavor}.{font_format}')
-                    match font_format:
-                        case 'otf.woff':
-                            builder.save_otf(file_path, flavor=opentype.Flavor.WOFF)
-                        case 'otf.woff2':
-                            builder.save_otf(file_path, flavor=opentype.Flavor.WOFF2)
-                        case 'ttf.woff':
-                            builder.save_ttf(file_path, flavor=opentype.Flavor.WOFF)
-                        case 'ttf.woff2':
-                            builder.save_ttf(file_path, flavor=opentype.Flavor.WOFF2)
-                        case _:
-                            getattr(builder, f'save_{font_format}')(file_path)
-                    logger.info("Make font: '{}'", file_path)
-
-
-def load_design_contexts(font_sizes: list[FontSize]) -> dict[FontSize, DesignContext]:
-    design_contexts = {font_size: DesignContext.load(font_size) for font_size in font_sizes}
+                for file_path in self._make_font_files(builder, language_flavor, language_font_formats):
+                    on_font_made(flavor_digests.get(language_flavor), file_path)
+            if len(pending_collection_font_formats) > 0:
+                for file_path in self._make_font_collection_files(pending_collection_font_formats):
+                    on_font_made(collection_digest, file_path)
+
+
+def get_font_file_path(font_size: FontSize, language_flavor: LanguageFlavor, font_format: FontFormat) -> Path:
+    return path_define.outputs_dir.joinpath(f'capsule-pixel-{font_size}px-{language_flavor}.{font_format}')
+
+
+def get_font_collection_file_path(font_size: FontSize, font_format: FontCollectionFormat) -> Path:
+    return path_define.outputs_dir.joinpath(f'capsule-pixel-{font_size}px.{font_format}')
+
+
+def get_font_file_paths(font_size: FontSize, font_format: FontFormat | FontCollectionFormat) -> list[Path]:
+    if font_format in options.font_collection_formats:
+        return [get_font_collection_file_path(font_size, font_format)]
+    return [get_font_file_path(font_size, language_flavor, font_format) for language_flavor in options.language_flavors]
+
+
+def _get_glyph_key(glyph_keys: dict[GlyphFile, tuple[str, int, int, bytes]], glyph_file: GlyphFile) -> tuple[str, int, int, bytes]:
+    glyph_key = glyph_keys.get(glyph_file)
+    if glyph_key is None:
+        glyph_key = glyph_file.glyph_name, glyph_file.width, glyph_file.height, bytes(color for bitmap_row in glyph_file.bitmap for color in bitmap_row)
+        glyph_keys[glyph_file] = glyph_key
+    return glyph_key
+
+
+def _compile_sfnt(builder: FontBuilder, is_ttf: bool) -> bytes:
+    buffer = BytesIO()
+    if is_ttf:
+        builder.to_ttf_builder().save(buffer)
+    else:
+        builder.to_otf_builder().save(buffer)
+    return buffer.getvalue()
+
+
+def _save_sfnt_with_flavor(data: bytes, file_path: Path, flavor: opentype.Flavor):
+    font = TTFont(BytesIO(data), recalcBBoxes=False, recalcTimestamp=False)
+    font.flavor = flavor
+    font.save(file_path)
+
+
+def _group_font_formats(font_formats: list[FontFormat]) -> list[list[FontFormat]]:
+    groups = {}
+    for font_format in font_formats:
+        groups.setdefault(font_format.partition('.')[0], []).append(font_format)
+    return list(groups.values())
+
+
+_worker_design_context: DesignContext | None = None
+_worker_builders: dict[LanguageFlavor, FontBuilder] = {}
+
+
+def _init_font_worker(design_context: DesignContext):
+    global _worker_design_context
+    _worker_design_context = design_context
+    _worker_builders.clear()
+
+
+def _make_font_worker(language_flavor: LanguageFlavor, font_formats: list[FontFormat]) -> list[Path]:
+    builder = _worker_builders.get(language_flavor)
+    if builder is None:
+        builder = _worker_design_context._create_builder(language_flavor)
+        _worker_builders[language_flavor] = builder
+    return _worker_design_context._make_font_files(builder, language_flavor, font_formats)
+
+
+def _make_font_collection_worker(font_formats: list[FontCollectionFormat]) -> list[Path]:
+    return _worker_design_context._make_font_collection_files(font_formats)
+
+
+_design_context_pool: dict[tuple[FontSize, bool, bool, KerningMode], DesignContext] | None = None
+
+
+def enable_design_context_pool():
+    global _design_context_pool
+    _design_context_pool = {}
+
+
+@trace_service.traced
+def load_design_contexts(font_sizes: list[FontSize], use_cache: bool = True, use_archive: bool = False, kerning_mode: KerningMode = 'pair') -> dict[FontSize, DesignContext]:
+    if _design_context_pool is None:
+        return {font_size: DesignContext.load(font_size, use_cache, use_archive, kerning_mode) for font_size in font_sizes}
+
+    design_contexts = {}
+    for font_size in font_sizes:
+        key = font_size, use_cache, use_archive, kerning_mode
+        design_context = _design_context_pool.get(key)
+        if design_context is None:
+            design_context = DesignContext.load(font_size, use_cache, use_archive, kerning_mode)
+            _design_context_pool[key] = design_context
+        design_contexts[font_size] = design_context
     return design_contexts
+
+
+@trace_service.traced
+def reload_design_contexts(design_contexts: list[DesignContext], changed_file_paths: set[Path], use_cache: bool = True) -> dict[DesignContext, list[LanguageFlavor]]:
+    configs_changed = any(file_path.is_relative_to(path_define.configs_dir) for file_path in changed_file_paths)
+    mappings_changed = any(file_path.is_relative_to(path_define.mappings_dir) for file_path in changed_file_paths)
+    kernings_changed = any(file_path.is_relative_to(path_define.kernings_dir) for file_path in changed_file_paths)
+    if configs_changed:
+        configs.reload('font_configs')
+    if mappings_changed:
+        configs.reload('mappings')
+    if kernings_changed:
+        configs.reload('kerning_config')
+
+    changed_language_flavors = {}
+    for design_context in design_contexts:
+        code_points = None
+        if not mappings_changed:
+            code_points = change_service.get_glyph_code_points(changed_file_paths, design_context.font_size)
+        if code_points is not None:
+            code_points = change_service.get_mapping_dependents(changed_file_paths, code_points)
+            if len(code_points) == 0 and not kernings_changed:
+                continue
+        language_flavors = design_context.reload(code_points, use_cache)
+        if path_define.configs_dir.joinpath(f'font-{design_context.font_size}px.yml') in changed_file_paths:
+            language_flavors = list(options.language_flavors)
+        changed_language_flavors[design_context] = language_flavors
+        logger.info('Changed flavors: {}px {}', design_context.font_size, changed_language_flavors[design_context])
+    return changed_language_flavors
+
+
+def get_pooled_design_contexts() -> list[DesignContext]:
+    if _design_context_pool is None:
+        return []
+    return list(_design_context_pool.values())
+
+
+def reload_design_context_pool(changed_file_paths: set[Path]):
+    if _design_context_pool is None:
+        return
+    # Archive-backed contexts do not follow the glyph sources, so load them again on the next request.
+    for key in [key for key in _design_context_pool if key[2]]:
+        _design_context_pool.pop(key)
+    for use_cache in (True, False):
+        design_contexts = [design_context for (_, key_use_cache, _, _), design_context in _design_context_pool.items() if key_use_cache == use_cache]
+        if len(design_contexts) > 0:
+            reload_design_contexts(design_contexts, changed_file_paths, use_cache)
@@ -1,19 +1,86 @@
-from pixel_font_knife import glyph_file_util, glyph_mapping_util
+import shutil
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+import unidata_blocks
+from loguru import logger
+from pixel_font_knife import fs_util, glyph_mapping_util
+from pixel_font_knife.glyph_file_util import GlyphFile
 
 from tools.configs import path_define, options
 from tools.configs.options import FontSize
+from tools.services import glyph_service
+
+
+# Mirrors the path rules of glyph_file_util.normalize_context in pixel-font-knife 0.0.21, which has no dry-run mode.
+# Re-check these rules whenever that pinned version changes.
+def _get_normalized_file_path(root_dir: Path, glyph_file: GlyphFile) -> Path:
+    if glyph_file.code_point == -1:
+        code_name = 'notdef'
+        file_dir = root_dir
+    else:
+        code_name = f'{glyph_file.code_point:04X}'
+        block = unidata_blocks.get_block_by_code_point(glyph_file.code_point)
+        file_dir = root_dir.joinpath(f'{block.code_start:04X}-{block.code_end:04X} {block.name}')
+        if block.name == 'CJK Unified Ideographs':
+            file_dir = file_dir.joinpath(f'{code_name[0:-2]}-')
+
+    if len(glyph_file.flavors) > 0:
+        flavors = sorted(glyph_file.flavors, key=lambda x: options.language_flavors.index(x))
+        file_name = f'{code_name} {','.join(flavors)}.png'
+    else:
+        file_name = f'{code_name}.png'
+    return file_dir.joinpath(file_name)
 
 
-def format_glyphs(font_size: FontSize):
-    for width_mode_dir_name in ('common', 'proportional'):
+def format_glyphs(font_size: FontSize, code_points: set[int] | None = None, check: bool = False) -> list[Path]:
+    changed_file_paths = []
+    for width_mode_dir_name, context in glyph_service.load_contexts(font_size, code_points=code_points).items():
         width_mode_dir = path_define.glyphs_dir.joinpath(font_size, width_mode_dir_name)
-        context = glyph_file_util.load_context(width_mode_dir)
-        glyph_file_util.normalize_context(context, width_mode_dir, options.language_flavors)
+        for flavor_group in context.values():
+            for glyph_file in sorted(set(flavor_group.values()), key=lambda x: x.file_path):
+                file_path = _get_normalized_file_path(width_mode_dir, glyph_file)
+                buffer = BytesIO()
+                glyph_file.bitmap.dump_png(buffer)
+                data = buffer.getvalue()
+                if file_path == glyph_file.file_path and file_path.read_bytes() == data:
+                    continue
+
+                changed_file_paths.append(glyph_file.file_path)
+                if check:
+                    logger.info("Would format glyph: '{}'", glyph_file.file_path)
+                    continue
+
+                if file_path != glyph_file.file_path:
+                    assert not file_path.exists(), f"[{font_size}px] duplicate glyph files:\n'{glyph_file.file_path}'\n'{file_path}'"
+                    file_path.parent.mkdir(parents=True, exist_ok=True)
+                    glyph_file.file_path.rename(file_path)
+                    glyph_file.file_path = file_path
+                file_path.write_bytes(data)
+                logger.info("Format glyph: '{}'", file_path)
+
+        if not check:
+            for file_dir, _, _ in width_mode_dir.walk(top_down=False):
+                if fs_util.is_empty_dir(file_dir):
+                    shutil.rmtree(file_dir)
+    return changed_file_paths
+
 
+def format_mappings(file_paths: list[Path], check: bool = False) -> list[Path]:
+    changed_file_paths = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for file_path in file_paths:
+            mapping = glyph_mapping_util.load_mapping(file_path)
+            temp_file_path = Path(temp_dir, file_path.name)
+            glyph_mapping_util.save_mapping(mapping, temp_file_path, options.language_flavors)
+            if temp_file_path.read_bytes() == file_path.read_bytes():
+                continue
 
-def format_mappings():
-    for file_path in path_define.mappings_dir.iterdir():
-        if file_path.suffix != '.yml':
-            continue
-        mapping = glyph_mapping_util.load_mapping(file_path)
-        glyph_mapping_util.save_mapping(mapping, file_path, options.language_flavors)
+            changed_file_paths.append(file_path)
+            if check:
+                logger.info("Would format mapping: '{}'", file_path)
+            else:
+                shutil.copyfile(temp_file_path, file_path)
+                logger.info("Format mapping: '{}'", file_path)
+    return changed_file_paths
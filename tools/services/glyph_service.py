@@ -0,0 +1,360 @@
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+from pixel_font_knife import glyph_file_util
+from pixel_font_knife.glyph_file_util import GlyphFile, GlyphFlavorGroup
+from pixel_font_knife.mono_bitmap import MonoBitmap
+
+from tools.configs import path_define
+from tools.configs.options import FontSize
+
+_CACHE_VERSION = 1
+_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+_ARCHIVE_MAGIC = b'CPGA'
+_ARCHIVE_VERSION = 2
+_archive_header = struct.Struct('<4sHI32s')
+_archive_entry = struct.Struct('<BiHHIIH')
+
+_width_mode_dir_names = ('common', 'proportional')
+
+
+def _pack_bitmap(bitmap: MonoBitmap) -> bytes:
+    row_size = (bitmap.width + 7) // 8
+    data = bytearray()
+    for bitmap_row in bitmap:
+        value = 0
+        for color in bitmap_row:
+            value = (value << 1) | color
+        data += (value << (row_size * 8 - bitmap.width)).to_bytes(row_size)
+    return bytes(data)
+
+
+def _unpack_bitmap(width: int, height: int, data: bytes) -> MonoBitmap:
+    row_size = (width + 7) // 8
+    bitmap = MonoBitmap()
+    bitmap.width = width
+    bitmap.height = height
+    for i in range(height):
+        value = int.from_bytes(data[i * row_size:(i + 1) * row_size]) >> (row_size * 8 - width)
+        bitmap.append([(value >> (width - 1 - x)) & 1 for x in range(width)])
+    return bitmap
+
+
+class GlyphCache:
+    @staticmethod
+    def load(file_path: Path) -> GlyphCache:
+        if file_path.is_file():
+            try:
+                data = pickle.loads(file_path.read_bytes())
+                if data['version'] == _CACHE_VERSION:
+                    return GlyphCache(file_path, data['generation'] + 1, data['files'], data['bitmaps'])
+            except Exception as e:
+                logger.warning("Discard broken glyph cache: '{}' ({})", file_path, e)
+        return GlyphCache(file_path, 0, {}, {})
+
+    file_path: Path
+    generation: int
+    files: dict[str, tuple[int, int, str]]
+    bitmaps: dict[str, tuple[int, int, bytes, int]]
+    _visited_keys: set[str]
+    _dirty: bool
+
+    def __init__(
+            self,
+            file_path: Path,
+            generation: int,
+            files: dict[str, tuple[int, int, str]],
+            bitmaps: dict[str, tuple[int, int, bytes, int]],
+    ):
+        self.file_path = file_path
+        self.generation = generation
+        self.files = files
+        self.bitmaps = bitmaps
+        self._visited_keys = set()
+        self._dirty = False
+
+    def get_bitmap(self, key: str, file_path: Path) -> MonoBitmap | None:
+        self._visited_keys.add(key)
+        stat = os.stat(file_path)
+        entry = self.files.get(key)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            digest = entry[2]
+        else:
+            digest = hashlib.sha256(file_path.read_bytes()).hexdigest()
+            self.files[key] = stat.st_size, stat.st_mtime_ns, digest
+            self._dirty = True
+
+        if digest not in self.bitmaps:
+            return None
+        width, height, data, _ = self.bitmaps[digest]
+        self.bitmaps[digest] = width, height, data, self.generation
+        return _unpack_bitmap(width, height, data)
+
+    def put_bitmap(self, key: str, bitmap: MonoBitmap):
+        self.bitmaps[self.files[key][2]] = bitmap.width, bitmap.height, _pack_bitmap(bitmap), self.generation
+        self._dirty = True
+
+    def save(self, key_prefix: str | None = None):
+        if key_prefix is not None:
+            for key in [key for key in self.files if key.startswith(key_prefix) and key not in self._visited_keys]:
+                self.files.pop(key)
+                self._dirty = True
+        if not self._dirty:
+            return
+
+        total_bytes = sum(len(data) for _, _, data, _ in self.bitmaps.values())
+        if total_bytes > _CACHE_MAX_BYTES:
+            for digest, (_, _, data, _) in sorted(self.bitmaps.items(), key=lambda item: item[1][3]):
+                if total_bytes <= _CACHE_MAX_BYTES:
+                    break
+                self.bitmaps.pop(digest)
+                total_bytes -= len(data)
+            digests = set(self.bitmaps)
+            self.files = {key: entry for key, entry in self.files.items() if entry[2] in digests}
+
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file_path = self.file_path.with_name(f'{self.file_path.name}.{os.getpid()}.tmp')
+        try:
+            temp_file_path.write_bytes(pickle.dumps({
+                'version': _CACHE_VERSION,
+                'generation': self.generation,
+                'files': self.files,
+                'bitmaps': self.bitmaps,
+            }, pickle.HIGHEST_PROTOCOL))
+            os.replace(temp_file_path, self.file_path)
+        finally:
+            temp_file_path.unlink(missing_ok=True)
+        self._dirty = False
+
+
+class DecodedGlyphFile(GlyphFile):
+    _decoded_bitmap: MonoBitmap
+
+    def __init__(self, glyph_file: GlyphFile, bitmap: MonoBitmap):
+        super().__init__(glyph_file.file_path, glyph_file.code_point, glyph_file.flavors)
+        self._decoded_bitmap = bitmap
+
+    @property
+    def bitmap(self) -> MonoBitmap:
+        return self._decoded_bitmap
+
+
+def get_cache_file_path() -> Path:
+    return path_define.cache_dir.joinpath('glyphs.bin')
+
+
+def _load_context(
+        font_size: FontSize,
+        width_mode_dir_name: str,
+        cache: GlyphCache | None,
+        code_points: set[int] | None,
+) -> dict[int, GlyphFlavorGroup]:
+    root_dir = path_define.glyphs_dir.joinpath(font_size, width_mode_dir_name)
+    context = glyph_file_util.load_context(root_dir)
+    if code_points is not None:
+        context = {code_point: flavor_group for code_point, flavor_group in context.items() if code_point in code_points}
+    context = dict(sorted(context.items()))
+    glyph_files = sorted({glyph_file for flavor_group in context.values() for glyph_file in flavor_group.values()}, key=lambda x: x.file_path)
+
+    bitmaps = {}
+    if cache is not None:
+        root_dir_str = str(root_dir)
+        key_prefix = f'{font_size}/{width_mode_dir_name}/'
+        for glyph_file in glyph_files:
+            key = key_prefix + os.path.relpath(glyph_file.file_path, root_dir_str).replace(os.sep, '/')
+            bitmap = cache.get_bitmap(key, glyph_file.file_path)
+            if bitmap is None:
+                bitmap = MonoBitmap.load_png(glyph_file.file_path)
+                cache.put_bitmap(key, bitmap)
+            bitmaps[glyph_file] = bitmap
+    else:
+        for glyph_file in glyph_files:
+            bitmaps[glyph_file] = MonoBitmap.load_png(glyph_file.file_path)
+
+    decoded_glyph_files = {glyph_file: DecodedGlyphFile(glyph_file, bitmap) for glyph_file, bitmap in bitmaps.items()}
+    for flavor_group in context.values():
+        for flavor in list(flavor_group):
+            flavor_group[flavor] = decoded_glyph_files[flavor_group[flavor]]
+    return context
+
+
+def load_contexts(
+        font_size: FontSize,
+        use_cache: bool = True,
+        code_points: set[int] | None = None,
+) -> dict[str, dict[int, GlyphFlavorGroup]]:
+    cache = GlyphCache.load(get_cache_file_path()) if use_cache else None
+    contexts = {width_mode_dir_name: _load_context(font_size, width_mode_dir_name, cache, code_points) for width_mode_dir_name in _width_mode_dir_names}
+    if cache is not None:
+        cache.save(f'{font_size}/' if code_points is None else None)
+    return contexts
+
+
+class ArchiveGlyphFile(GlyphFile):
+    _archive_width: int
+    _archive_height: int
+    _archive_data: memoryview | None
+
+    def __init__(
+            self,
+            file_path: Path,
+            code_point: int,
+            flavors: list[str],
+            width: int,
+            height: int,
+            data: memoryview,
+    ):
+        super().__init__(file_path, code_point, flavors)
+        self._archive_width = width
+        self._archive_height = height
+        self._archive_data = data
+
+    @property
+    def bitmap(self) -> MonoBitmap:
+        if self._bitmap is None:
+            self._bitmap = _unpack_bitmap(self._archive_width, self._archive_height, self._archive_data)
+        return self._bitmap
+
+    @property
+    def width(self) -> int:
+        return self._archive_width
+
+    @property
+    def height(self) -> int:
+        return self._archive_height
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = vars(self).copy()
+        state['_bitmap'] = self.bitmap
+        state['_archive_data'] = None
+        return state
+
+
+def get_archive_file_path(font_size: FontSize) -> Path:
+    return path_define.archives_dir.joinpath(f'glyphs-{font_size}.cpga')
+
+
+def _get_source_digest(font_size: FontSize) -> bytes:
+    hasher = hashlib.sha256()
+    for width_mode_dir_name in _width_mode_dir_names:
+        root_dir = path_define.glyphs_dir.joinpath(font_size, width_mode_dir_name)
+        entries = []
+        for dir_path, _, file_names in os.walk(root_dir):
+            for file_name in file_names:
+                if not file_name.endswith('.png'):
+                    continue
+                file_path = os.path.join(dir_path, file_name)
+                stat = os.stat(file_path)
+                entries.append((os.path.relpath(file_path, root_dir).replace(os.sep, '/'), stat.st_size, stat.st_mtime_ns))
+        for relative_path, size, mtime_ns in sorted(entries):
+            hasher.update(f'{width_mode_dir_name}/{relative_path}\0{size}\0{mtime_ns}\n'.encode('utf-8'))
+    return hasher.digest()
+
+
+def export_archive(font_size: FontSize) -> Path:
+    source_digest = _get_source_digest(font_size)
+    entries = []
+    for width_mode_index, (width_mode_dir_name, context) in enumerate(load_contexts(font_size).items()):
+        root_dir_str = str(path_define.glyphs_dir.joinpath(font_size, width_mode_dir_name))
+        for glyph_file in sorted({glyph_file for flavor_group in context.values() for glyph_file in flavor_group.values()}, key=lambda x: x.file_path):
+            relative_path = os.path.relpath(glyph_file.file_path, root_dir_str).replace(os.sep, '/')
+            entries.append((width_mode_index, glyph_file.code_point, relative_path.encode('utf-8'), glyph_file.bitmap))
+
+    strings_offset = _archive_header.size + _archive_entry.size * len(entries)
+    data_offset = strings_offset + sum(len(relative_path) for _, _, relative_path, _ in entries)
+    table = bytearray(_archive_header.pack(_ARCHIVE_MAGIC, _ARCHIVE_VERSION, len(entries), source_digest))
+    strings = bytearray()
+    data = bytearray()
+    for width_mode_index, code_point, relative_path, bitmap in entries:
+        table += _archive_entry.pack(width_mode_index, code_point, bitmap.width, bitmap.height, data_offset + len(data), strings_offset + len(strings), len(relative_path))
+        strings += relative_path
+        data += _pack_bitmap(bitmap)
+
+    file_path = get_archive_file_path(font_size)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_file_path = file_path.with_name(f'{file_path.name}.{os.getpid()}.tmp')
+    try:
+        temp_file_path.write_bytes(table + strings + data)
+        os.replace(temp_file_path, file_path)
+    finally:
+        temp_file_path.unlink(missing_ok=True)
+    logger.info("Make glyph archive: '{}'", file_path)
+    return file_path
+
+
+def _read_archive_source_digest(file_path: Path) -> bytes | None:
+    if not file_path.is_file():
+        return None
+    with open(file_path, 'rb') as file:
+        header = file.read(_archive_header.size)
+    if len(header) < _archive_header.size:
+        return None
+    magic, version, _, source_digest = _archive_header.unpack(header)
+    if magic != _ARCHIVE_MAGIC or version != _ARCHIVE_VERSION:
+        return None
+    return source_digest
+
+
+def _read_archive(file_path: Path) -> list[list[ArchiveGlyphFile]]:
+    with open(file_path, 'rb') as file:
+        buffer = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    magic, version, count, _ = _archive_header.unpack_from(buffer)
+    assert magic == _ARCHIVE_MAGIC and version == _ARCHIVE_VERSION, f"unsupported glyph archive: '{file_path}'"
+
+    glyph_files = [[] for _ in _width_mode_dir_names]
+    for width_mode_index, code_point, width, height, data_offset, path_offset, path_size in _archive_entry.iter_unpack(buffer[_archive_header.size:_archive_header.size + _archive_entry.size * count]):
+        relative_path = str(buffer[path_offset:path_offset + path_size], 'utf-8')
+        glyph_file = GlyphFile.load(Path(relative_path))
+        assert glyph_file.code_point == code_point, f"broken glyph archive entry: '{relative_path}'"
+        data_size = (width + 7) // 8 * height
+        glyph_files[width_mode_index].append(ArchiveGlyphFile(
+            Path(relative_path),
+            code_point,
+            glyph_file.flavors,
+            width,
+            height,
+            buffer[data_offset:data_offset + data_size],
+        ))
+    return glyph_files
+
+
+def load_archive_contexts(font_size: FontSize) -> dict[str, dict[int, GlyphFlavorGroup]]:
+    file_path = get_archive_file_path(font_size)
+    if _read_archive_source_digest(file_path) != _get_source_digest(font_size):
+        logger.warning("Glyph archive is stale or missing, rebuilding: '{}'", file_path)
+        export_archive(font_size)
+
+    contexts = {}
+    for width_mode_dir_name, glyph_files in zip(_width_mode_dir_names, _read_archive(file_path)):
+        root_dir = path_define.glyphs_dir.joinpath(font_size, width_mode_dir_name)
+        context = {}
+        for glyph_file in glyph_files:
+            glyph_file.file_path = root_dir.joinpath(glyph_file.file_path)
+            flavor_group = context.setdefault(glyph_file.code_point, GlyphFlavorGroup())
+            for flavor in glyph_file.flavors if len(glyph_file.flavors) > 0 else [None]:
+                assert flavor not in flavor_group, f"duplicate flavor {repr(flavor)}: '{glyph_file.file_path}'"
+                flavor_group[flavor] = glyph_file
+        contexts[width_mode_dir_name] = dict(sorted(context.items()))
+    return contexts
+
+
+def import_archive(font_size: FontSize, file_path: Path | None = None) -> list[Path]:
+    if file_path is None:
+        file_path = get_archive_file_path(font_size)
+    file_paths = []
+    for width_mode_dir_name, glyph_files in zip(_width_mode_dir_names, _read_archive(file_path)):
+        root_dir = path_define.glyphs_dir.joinpath(font_size, width_mode_dir_name)
+        for glyph_file in glyph_files:
+            glyph_file.file_path = root_dir.joinpath(glyph_file.file_path)
+            glyph_file.file_path.parent.mkdir(parents=True, exist_ok=True)
+            glyph_file.save()
+            file_paths.append(glyph_file.file_path)
+    logger.info("Import glyph archive: '{}' ({} files)", file_path, len(file_paths))
+    return file_paths
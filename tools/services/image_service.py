@@ -1,25 +1,98 @@
 import math
+from pathlib import Path
 
-from PIL import Image, ImageFont, ImageDraw
-from PIL.ImageFont import FreeTypeFont
+from PIL import Image
 from loguru import logger
+from pixel_font_knife.glyph_file_util import GlyphFile
 
 from tools import configs
 from tools.configs import path_define
 from tools.configs.options import FontSize, LanguageFlavor
+from tools.services import trace_service
 from tools.services.font_service import DesignContext
 
 
-def _load_font(font_size: FontSize, language_flavor: LanguageFlavor, scale: int = 1) -> FreeTypeFont:
-    file_path = path_define.outputs_dir.joinpath(f'capsule-pixel-{font_size}px-{language_flavor}.otf.woff2')
-    return ImageFont.truetype(file_path, configs.font_configs[font_size].font_size_y * scale)
+class BitmapFont:
+    design_context: DesignContext
+    language_flavor: LanguageFlavor
+    scale: int
+    _masks: dict[GlyphFile, Image.Image]
+    _sprites: dict[str, tuple[Image.Image, tuple[int, int]]]
+
+    def __init__(
+            self,
+            design_context: DesignContext,
+            language_flavor: LanguageFlavor,
+            scale: int = 1,
+    ):
+        self.design_context = design_context
+        self.language_flavor = language_flavor
+        self.scale = scale
+        self._masks = {}
+        self._sprites = {}
+
+    @property
+    def ascent(self) -> int:
+        return configs.font_configs[self.design_context.font_size].ascent * self.scale
+
+    @property
+    def line_height(self) -> int:
+        return configs.font_configs[self.design_context.font_size].line_height * self.scale
+
+    def _get_mask(self, glyph_file: GlyphFile) -> Image.Image:
+        mask = self._masks.get(glyph_file)
+        if mask is None:
+            mask = Image.frombytes('L', (glyph_file.width, glyph_file.height), bytes(255 if color != 0 else 0 for bitmap_row in glyph_file.bitmap for color in bitmap_row))
+            if self.scale > 1:
+                mask = mask.resize((glyph_file.width * self.scale, glyph_file.height * self.scale), Image.Resampling.NEAREST)
+            self._masks[glyph_file] = mask
+        return mask
+
+    def _get_origin(self, glyph_file: GlyphFile) -> tuple[int, int]:
+        horizontal_offset_x, horizontal_offset_y = self.design_context.glyph_table[glyph_file].horizontal_offset
+        return horizontal_offset_x * self.scale, self.ascent - (horizontal_offset_y + glyph_file.height) * self.scale
+
+    def get_char_sprite(self, c: str) -> tuple[Image.Image, tuple[int, int]]:
+        sprite = self._sprites.get(c)
+        if sprite is None:
+            glyph_file = self.design_context.get_glyph_file(ord(c), self.language_flavor)
+            sprite = self._get_mask(glyph_file), self._get_origin(glyph_file)
+            self._sprites[c] = sprite
+        return sprite
+
+    def _layout(self, text: str) -> tuple[list[tuple[int, GlyphFile]], int]:
+        glyph_table = self.design_context.glyph_table
+        kerning_values = self.design_context.kerning_values
+        positions = []
+        x = 0
+        last_glyph_file = None
+        for c in text:
+            glyph_file = self.design_context.get_glyph_file(ord(c), self.language_flavor)
+            if last_glyph_file is not None:
+                x += kerning_values.get((last_glyph_file.glyph_name, glyph_file.glyph_name), 0)
+            positions.append((x, glyph_file))
+            x += glyph_table[glyph_file].advance_width
+            last_glyph_file = glyph_file
+        return positions, x
+
+    def get_text_width(self, text: str) -> int:
+        return self._layout(text)[1] * self.scale
+
+    def draw_text(self, image: Image.Image, xy: tuple[int, int], text: str, color: tuple[int, int, int, int]):
+        x, y = xy
+        positions, _ = self._layout(text)
+        for offset_x, glyph_file in positions:
+            if glyph_file.width == 0 or glyph_file.height == 0:
+                continue
+            left, top = self._get_origin(glyph_file)
+            image.paste(color, (x + offset_x * self.scale + left, y + top), self._get_mask(glyph_file))
 
 
 def _draw_text(
         image: Image.Image,
         xy: tuple[float, float],
         text: str,
-        font: FreeTypeFont,
+        font: BitmapFont,
         text_color: tuple[int, int, int, int] = (0, 0, 0, 255),
         shadow_color: tuple[int, int, int, int] | None = None,
         line_height: int | None = None,
@@ -27,20 +100,20 @@ def _draw_text(
         is_horizontal_centered: bool = False,
         is_vertical_centered: bool = False,
 ):
-    draw = ImageDraw.Draw(image)
     x, y = xy
-    default_line_height = sum(font.getmetrics())
     if line_height is None:
-        line_height = default_line_height
-    y += (line_height - default_line_height) / 2
-    spacing = line_height + line_gap - font.getbbox('A')[3]
-    if is_horizontal_centered:
-        x -= draw.textbbox((0, 0), text, font=font)[2] / 2
+        line_height = font.line_height
+    y += (line_height - font.line_height) / 2
     if is_vertical_centered:
         y -= line_height / 2
-    if shadow_color is not None:
-        draw.text((x + 1, y + 1), text, fill=shadow_color, font=font, spacing=spacing)
-    draw.text((x, y), text, fill=text_color, font=font, spacing=spacing)
+    for line in text.split('\n'):
+        line_x = x
+        if is_horizontal_centered:
+            line_x -= font.get_text_width(line) / 2
+        if shadow_color is not None:
+            font.draw_text(image, (math.ceil(line_x) + 1, math.ceil(y) + 1), line, shadow_color)
+        font.draw_text(image, (math.ceil(line_x), math.ceil(y)), line, text_color)
+        y += line_height + line_gap
 
 
 def _draw_text_background(
@@ -50,29 +123,31 @@ def _draw_text_background(
         font_size_x: int,
         box_width: int,
         box_height: int,
-        font: FreeTypeFont,
+        font: BitmapFont,
         text_color: tuple[int, int, int, int],
 ):
-    draw = ImageDraw.Draw(image)
     alphabet = [c for c in alphabet if 0x4E00 <= ord(c) <= 0x9FFF]
     if not alphabet:
         alphabet.append('\u3000')
     count_x = math.ceil(image.width / box_width)
     count_y = math.ceil(image.height / box_height)
     offset_x = (image.width - count_x * box_width) / 2 + (box_width - font_size_x) / 2
-    offset_y = (image.height - count_y * box_height) / 2 + (box_height - sum(font.getmetrics())) / 2
+    offset_y = (image.height - count_y * box_height) / 2 + (box_height - font.line_height) / 2
     alphabet_index = 0
     for y in range(count_y):
         for x in range(count_x):
-            draw.text((offset_x + x * box_width, offset_y + y * box_height), alphabet[alphabet_index % len(alphabet)], fill=text_color, font=font)
+            mask, (left, top) = font.get_char_sprite(alphabet[alphabet_index % len(alphabet)])
+            image.paste(text_color, (math.ceil(offset_x + x * box_width) + left, math.ceil(offset_y + y * box_height) + top), mask)
             alphabet_index += step
 
 
-def make_preview_image(font_size: FontSize):
-    font_latin = _load_font(font_size, 'latin')
-    font_zh_cn = _load_font(font_size, 'zh_cn')
-    font_zh_tr = _load_font(font_size, 'zh_tr')
-    font_ja = _load_font(font_size, 'ja')
+@trace_service.traced
+def make_preview_image(design_context: DesignContext) -> Path:
+    font_size = design_context.font_size
+    font_latin = design_context.get_bitmap_font('latin')
+    font_zh_cn = design_context.get_bitmap_font('zh_cn')
+    font_zh_tr = design_context.get_bitmap_font('zh_tr')
+    font_ja = design_context.get_bitmap_font('ja')
     font_config = configs.font_configs[font_size]
     font_size_x = font_config.font_size_x
     line_height = font_config.line_height
@@ -93,11 +168,13 @@ def make_preview_image(font_size: FontSize):
     file_path = path_define.outputs_dir.joinpath(f'preview-{font_size}px.png')
     image.save(file_path)
     logger.info("Make preview image: '{}'", file_path)
+    return file_path
 
 
-def make_readme_banner(design_contexts: dict[FontSize, DesignContext]):
-    font_x1 = _load_font('12x16', 'zh_cn')
-    font_x2 = _load_font('12x16', 'zh_cn', 2)
+@trace_service.traced
+def make_readme_banner(design_contexts: dict[FontSize, DesignContext]) -> Path:
+    font_x1 = design_contexts['12x16'].get_bitmap_font('zh_cn')
+    font_x2 = design_contexts['12x16'].get_bitmap_font('zh_cn', 2)
     alphabet = sorted(design_contexts['12x16'].alphabet)
     font_config = configs.font_configs['12x16']
     line_height = font_config.line_height
@@ -119,12 +196,14 @@ def make_readme_banner(design_contexts: dict[FontSize, DesignContext]):
     file_path = path_define.outputs_dir.joinpath('readme-banner.png')
     image.save(file_path)
     logger.info("Make readme banner: '{}'", file_path)
+    return file_path
 
 
-def make_github_banner(design_contexts: dict[FontSize, DesignContext]):
-    font_title = _load_font('12x16', 'zh_cn', 2)
-    font_latin = _load_font('12x16', 'latin')
-    font_zh_cn = _load_font('12x16', 'zh_cn')
+@trace_service.traced
+def make_github_banner(design_contexts: dict[FontSize, DesignContext]) -> Path:
+    font_title = design_contexts['12x16'].get_bitmap_font('zh_cn', 2)
+    font_latin = design_contexts['12x16'].get_bitmap_font('latin')
+    font_zh_cn = design_contexts['12x16'].get_bitmap_font('zh_cn')
     alphabet = sorted(design_contexts['12x16'].alphabet)
     font_config = configs.font_configs['12x16']
     line_height = font_config.line_height
@@ -150,11 +229,13 @@ def make_github_banner(design_contexts: dict[FontSize, DesignContext]):
     file_path = path_define.outputs_dir.joinpath('github-banner.png')
     image.save(file_path)
     logger.info("Make github banner: '{}'", file_path)
+    return file_path
 
 
-def make_itch_io_banner(design_contexts: dict[FontSize, DesignContext]):
-    font_x1 = _load_font('12x16', 'zh_cn')
-    font_x2 = _load_font('12x16', 'zh_cn', 2)
+@trace_service.traced
+def make_itch_io_banner(design_contexts: dict[FontSize, DesignContext]) -> Path:
+    font_x1 = design_contexts['12x16'].get_bitmap_font('zh_cn')
+    font_x2 = design_contexts['12x16'].get_bitmap_font('zh_cn', 2)
     alphabet = sorted(design_contexts['12x16'].alphabet)
     font_config = configs.font_configs['12x16']
     line_height = font_config.line_height
@@ -176,14 +257,16 @@ def make_itch_io_banner(design_contexts: dict[FontSize, DesignContext]):
     file_path = path_define.outputs_dir.joinpath('itch-io-banner.png')
     image.save(file_path)
     logger.info("Make itch.io banner: '{}'", file_path)
+    return file_path
 
 
-def make_itch_io_cover():
-    font_title = _load_font('12x16', 'zh_cn', 2)
-    font_latin = _load_font('12x16', 'latin')
-    font_zh_cn = _load_font('12x16', 'zh_cn')
-    font_zh_tr = _load_font('12x16', 'zh_tr')
-    font_ja = _load_font('12x16', 'ja')
+@trace_service.traced
+def make_itch_io_cover(design_contexts: dict[FontSize, DesignContext]) -> Path:
+    font_title = design_contexts['12x16'].get_bitmap_font('zh_cn', 2)
+    font_latin = design_contexts['12x16'].get_bitmap_font('latin')
+    font_zh_cn = design_contexts['12x16'].get_bitmap_font('zh_cn')
+    font_zh_tr = design_contexts['12x16'].get_bitmap_font('zh_tr')
+    font_ja = design_contexts['12x16'].get_bitmap_font('ja')
     font_config = configs.font_configs['12x16']
     line_height = font_config.line_height
     text_color = (255, 255, 255, 255)
@@ -205,14 +288,16 @@ def make_itch_io_cover():
     file_path = path_define.outputs_dir.joinpath('itch-io-cover.png')
     image.save(file_path)
     logger.info("Make itch.io cover: '{}'", file_path)
+    return file_path
 
 
-def make_afdian_cover():
-    font_title = _load_font('12x16', 'zh_cn', 2)
-    font_latin = _load_font('12x16', 'latin')
-    font_zh_cn = _load_font('12x16', 'zh_cn')
-    font_zh_tr = _load_font('12x16', 'zh_tr')
-    font_ja = _load_font('12x16', 'ja')
+@trace_service.traced
+def make_afdian_cover(design_contexts: dict[FontSize, DesignContext]) -> Path:
+    font_title = design_contexts['12x16'].get_bitmap_font('zh_cn', 2)
+    font_latin = design_contexts['12x16'].get_bitmap_font('latin')
+    font_zh_cn = design_contexts['12x16'].get_bitmap_font('zh_cn')
+    font_zh_tr = design_contexts['12x16'].get_bitmap_font('zh_tr')
+    font_ja = design_contexts['12x16'].get_bitmap_font('ja')
     font_config = configs.font_configs['12x16']
     line_height = font_config.line_height
     text_color = (255, 255, 255, 255)
@@ -235,3 +320,4 @@ def make_afdian_cover():
     file_path = path_define.outputs_dir.joinpath('afdian-cover.png')
     image.save(file_path)
     logger.info("Make afdian cover: '{}'", file_path)
+    return file_path
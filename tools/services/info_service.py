@@ -1,8 +1,6 @@
-from collections import defaultdict
-from collections.abc import Callable
+from pathlib import Path
 from typing import TextIO
 
-import unicodedata2
 import unidata_blocks
 from character_encoding_utils import gb2312, big5, shiftjis, ksx1001
 from loguru import logger
@@ -10,49 +8,22 @@ from unidata_blocks import UnicodeBlock
 
 from tools import configs
 from tools.configs import path_define
+from tools.services import coverage_service, trace_service
+from tools.services.coverage_service import CoverageIndex
 from tools.services.font_service import DesignContext
 
 
-def _do_we_need_to_create_a_glyph(c: str) -> bool:
-    if c in ('\u0020', '\u3000'):
-        return True
-    category = unicodedata2.category(c)
-    return category.startswith(('L', 'M', 'N', 'P', 'S'))
-
-
-def _get_unicode_chr_count_infos(alphabet: set[str]) -> list[tuple[UnicodeBlock, int, int]]:
-    in_block_counts = defaultdict(int)
-    for c in alphabet:
-        block = unidata_blocks.get_block_by_chr(c)
-        if 'Private Use Area' not in block.name:
-            assert _do_we_need_to_create_a_glyph(c)
-        in_block_counts[block.code_start] += 1
+def _get_unicode_chr_count_infos(index: CoverageIndex, code_points: set[int]) -> list[tuple[UnicodeBlock, int, int]]:
+    assert index.unrequired_code_points.isdisjoint(code_points)
 
     count_infos = []
-    for code_start, count in sorted(in_block_counts.items()):
-        block = unidata_blocks.get_block_by_code_point(code_start)
-        total = 0
-        if 'Private Use Area' not in block.name:
-            for code_point in range(block.code_start, block.code_end + 1):
-                c = chr(code_point)
-                if _do_we_need_to_create_a_glyph(c):
-                    total += 1
-        count_infos.append((block, count, total))
-    return count_infos
-
-
-def _get_locale_chr_count_infos(alphabet: set[str], query_category_func: Callable[[str], str | None]) -> defaultdict[str, int]:
-    count_infos = defaultdict(int)
-    for c in alphabet:
-        category = query_category_func(c)
-        if category is not None:
-            count_infos[category] += 1
-            count_infos['total'] += 1
+    for code_start, count in index.count_blocks(code_points).items():
+        count_infos.append((unidata_blocks.get_block_by_code_point(code_start), count, index.block_totals[code_start]))
     return count_infos
 
 
-def _get_gb2312_chr_count_infos(alphabet: set[str]) -> list[tuple[str, int, int]]:
-    count_infos = _get_locale_chr_count_infos(alphabet, gb2312.query_category)
+def _get_gb2312_chr_count_infos(index: CoverageIndex, code_points: set[int]) -> list[tuple[str, int, int]]:
+    count_infos = index.count_charset('gb2312', code_points)
     return [
         ('一级汉字', count_infos['level-1'], gb2312.get_level_1_count()),
         ('二级汉字', count_infos['level-2'], gb2312.get_level_2_count()),
@@ -61,8 +32,8 @@ def _get_gb2312_chr_count_infos(alphabet: set[str]) -> list[tuple[str, int, int]
     ]
 
 
-def _get_big5_chr_count_infos(alphabet: set[str]) -> list[tuple[str, int, int]]:
-    count_infos = _get_locale_chr_count_infos(alphabet, big5.query_category)
+def _get_big5_chr_count_infos(index: CoverageIndex, code_points: set[int]) -> list[tuple[str, int, int]]:
+    count_infos = index.count_charset('big5', code_points)
     return [
         ('常用汉字', count_infos['level-1'], big5.get_level_1_count()),
         ('次常用汉字', count_infos['level-2'], big5.get_level_2_count()),
@@ -71,8 +42,8 @@ def _get_big5_chr_count_infos(alphabet: set[str]) -> list[tuple[str, int, int]]:
     ]
 
 
-def _get_shiftjis_chr_count_infos(alphabet: set[str]) -> list[tuple[str, int, int]]:
-    count_infos = _get_locale_chr_count_infos(alphabet, shiftjis.query_category)
+def _get_shiftjis_chr_count_infos(index: CoverageIndex, code_points: set[int]) -> list[tuple[str, int, int]]:
+    count_infos = index.count_charset('shiftjis', code_points)
     return [
         ('单字节-ASCII可打印字符', count_infos['single-byte-ascii-printable'], shiftjis.get_single_byte_ascii_printable_count()),
         ('单字节-半角片假名', count_infos['single-byte-half-width-katakana'], shiftjis.get_single_byte_half_width_katakana_count()),
@@ -82,8 +53,8 @@ def _get_shiftjis_chr_count_infos(alphabet: set[str]) -> list[tuple[str, int, in
     ]
 
 
-def _get_ksx1001_chr_count_infos(alphabet: set[str]) -> list[tuple[str, int, int]]:
-    count_infos = _get_locale_chr_count_infos(alphabet, ksx1001.query_category)
+def _get_ksx1001_chr_count_infos(index: CoverageIndex, code_points: set[int]) -> list[tuple[str, int, int]]:
+    count_infos = index.count_charset('ksx1001', code_points)
     return [
         ('谚文音节', count_infos['syllable'], ksx1001.get_syllable_count()),
         ('汉字', count_infos['hanja'], ksx1001.get_hanja_count()),
@@ -115,8 +86,11 @@ def _write_locale_chr_count_infos_table(file: TextIO, infos: list[tuple[str, int
         file.write(f'| {name} | {count} / {total} | {missing} | {progress:.2%} {finished_emoji} |\n')
 
 
-def make_info(design_context: DesignContext):
+@trace_service.traced
+def make_info(design_context: DesignContext) -> Path:
     alphabet = design_context.alphabet
+    code_points = {ord(c) for c in alphabet}
+    index = coverage_service.get_coverage_index()
 
     path_define.outputs_dir.mkdir(parents=True, exist_ok=True)
     file_path = path_define.outputs_dir.joinpath(f'info-{design_context.font_size}px.md')
@@ -134,38 +108,41 @@ def make_info(design_context: DesignContext):
         file.write('\n')
         file.write(f'Unicode 版本：{unidata_blocks.unicode_version}\n')
         file.write('\n')
-        _write_unicode_chr_count_infos_table(file, _get_unicode_chr_count_infos(alphabet))
+        _write_unicode_chr_count_infos_table(file, _get_unicode_chr_count_infos(index, code_points))
         file.write('\n')
         file.write('## GB2312 字符分布\n')
         file.write('\n')
         file.write('简体中文参考字符集。统计范围不包含 ASCII。\n')
         file.write('\n')
-        _write_locale_chr_count_infos_table(file, _get_gb2312_chr_count_infos(alphabet))
+        _write_locale_chr_count_infos_table(file, _get_gb2312_chr_count_infos(index, code_points))
         file.write('\n')
         file.write('## Big5 字符分布\n')
         file.write('\n')
         file.write('繁体中文参考字符集。统计范围不包含 ASCII。\n')
         file.write('\n')
-        _write_locale_chr_count_infos_table(file, _get_big5_chr_count_infos(alphabet))
+        _write_locale_chr_count_infos_table(file, _get_big5_chr_count_infos(index, code_points))
         file.write('\n')
         file.write('## Shift-JIS 字符分布\n')
         file.write('\n')
         file.write('日语参考字符集。\n')
         file.write('\n')
-        _write_locale_chr_count_infos_table(file, _get_shiftjis_chr_count_infos(alphabet))
+        _write_locale_chr_count_infos_table(file, _get_shiftjis_chr_count_infos(index, code_points))
         file.write('\n')
         file.write('## KS-X-1001 字符分布\n')
         file.write('\n')
         file.write('韩语参考字符集。统计范围不包含 ASCII。\n')
         file.write('\n')
-        _write_locale_chr_count_infos_table(file, _get_ksx1001_chr_count_infos(alphabet))
+        _write_locale_chr_count_infos_table(file, _get_ksx1001_chr_count_infos(index, code_points))
     logger.info("Make info: '{}'", file_path)
+    return file_path
 
 
-def make_alphabet_txt(design_context: DesignContext):
+@trace_service.traced
+def make_alphabet_txt(design_context: DesignContext) -> Path:
     alphabet = sorted(design_context.alphabet)
 
     path_define.outputs_dir.mkdir(parents=True, exist_ok=True)
     file_path = path_define.outputs_dir.joinpath(f'alphabet-{design_context.font_size}px.txt')
     file_path.write_text(''.join(alphabet), 'utf-8')
     logger.info("Make alphabet txt: '{}'", file_path)
+    return file_path
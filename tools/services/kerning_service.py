@@ -0,0 +1,167 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import defaultdict
+from io import StringIO
+from pathlib import Path
+
+from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+from fontTools.ttLib import TTFont
+from loguru import logger
+from pixel_font_builder import opentype
+from pixel_font_builder.opentype.feature import build_kern_feature
+from pixel_font_knife import kerning_util
+from pixel_font_knife.glyph_file_util import GlyphFlavorGroup
+from pixel_font_knife.kerning_util import KerningConfig
+
+from tools import configs
+from tools.configs import path_define
+from tools.configs.options import FontSize
+
+_CACHE_VERSION = 1
+
+
+class KerningClasses:
+    left_classes: list[list[str]]
+    right_classes: list[list[str]]
+    values: dict[tuple[int, int], int]
+
+    def __init__(
+            self,
+            left_classes: list[list[str]],
+            right_classes: list[list[str]],
+            values: dict[tuple[int, int], int],
+    ):
+        self.left_classes = left_classes
+        self.right_classes = right_classes
+        self.values = values
+
+
+def _get_group_digests(kerning_config: KerningConfig, glyph_files: dict[int, GlyphFlavorGroup]) -> dict[str, bytes]:
+    group_digests = {}
+    for group_name, alphabet in kerning_config.groups.items():
+        hasher = hashlib.sha256()
+        for c in alphabet:
+            flavor_group = glyph_files.get(ord(c))
+            if flavor_group is None:
+                hasher.update(b'\0')
+                continue
+            glyph_file = flavor_group.get_file()
+            hasher.update(f'{glyph_file.glyph_name}:{glyph_file.width}x{glyph_file.height}:'.encode('utf-8'))
+            hasher.update(bytes(color for bitmap_row in glyph_file.bitmap for color in bitmap_row))
+        group_digests[group_name] = hasher.digest()
+    return group_digests
+
+
+def calculate_kerning_values(font_size: FontSize, glyph_files: dict[int, GlyphFlavorGroup]) -> dict[tuple[str, str], int]:
+    kerning_config = configs.kerning_config
+    cache_file_path = path_define.cache_dir.joinpath(f'kerning-{font_size}.bin')
+    cache = {}
+    if cache_file_path.is_file():
+        try:
+            data = pickle.loads(cache_file_path.read_bytes())
+            if data['version'] == _CACHE_VERSION:
+                cache = data['templates']
+        except Exception as e:
+            logger.warning("Discard broken kerning cache: '{}' ({})", cache_file_path, e)
+
+    group_digests = _get_group_digests(kerning_config, glyph_files)
+    kerning_values = {}
+    templates = {}
+    computed_count = 0
+    for (left_group_name, right_group_name), offset in kerning_config.templates.items():
+        hasher = hashlib.sha256(f'{left_group_name},{right_group_name}:{offset}:'.encode('utf-8'))
+        hasher.update(group_digests[left_group_name])
+        hasher.update(group_digests[right_group_name])
+        digest = hasher.hexdigest()
+        pairs = cache.get(digest)
+        if pairs is None:
+            template_config = KerningConfig(
+                {group_name: kerning_config.groups[group_name] for group_name in (left_group_name, right_group_name)},
+                {(left_group_name, right_group_name): offset},
+            )
+            pairs = list(kerning_util.calculate_kerning_values(template_config, glyph_files).items())
+            computed_count += 1
+        templates[digest] = pairs
+        kerning_values.update(pairs)
+
+    if computed_count > 0 or templates.keys() != cache.keys():
+        cache_file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file_path = cache_file_path.with_name(f'{cache_file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            temp_file_path.write_bytes(pickle.dumps({
+                'version': _CACHE_VERSION,
+                'templates': templates,
+            }, pickle.HIGHEST_PROTOCOL))
+            os.replace(temp_file_path, cache_file_path)
+        finally:
+            temp_file_path.unlink(missing_ok=True)
+    logger.debug('Kerning templates: {} cached, {} computed', len(templates) - computed_count, computed_count)
+    return kerning_values
+
+
+def _partition(values: dict[tuple[str, str], int], key_index: int) -> list[list[str]]:
+    signatures = defaultdict(dict)
+    for pair, offset in values.items():
+        signatures[pair[key_index]][pair[1 - key_index]] = offset
+    members = defaultdict(list)
+    for glyph_name, signature in signatures.items():
+        members[tuple(sorted(signature.items()))].append(glyph_name)
+    return sorted(sorted(glyph_names) for glyph_names in members.values())
+
+
+def create_kerning_classes(kerning_values: dict[tuple[str, str], int]) -> KerningClasses:
+    left_classes = _partition(kerning_values, 0)
+    left_indices = {glyph_name: index for index, glyph_names in enumerate(left_classes) for glyph_name in glyph_names}
+    right_classes = _partition({(left_indices[left_glyph_name], right_glyph_name): offset for (left_glyph_name, right_glyph_name), offset in kerning_values.items()}, 1)
+    right_indices = {glyph_name: index for index, glyph_names in enumerate(right_classes) for glyph_name in glyph_names}
+    values = {}
+    for (left_glyph_name, right_glyph_name), offset in kerning_values.items():
+        values[(left_indices[left_glyph_name], right_indices[right_glyph_name])] = offset
+    return KerningClasses(left_classes, right_classes, dict(sorted(values.items())))
+
+
+def build_kern_class_feature(kerning_classes: KerningClasses, px_to_units: int) -> str:
+    text = StringIO()
+    text.write('languagesystem DFLT dflt;\n')
+    text.write('\n')
+    for index, glyph_names in enumerate(kerning_classes.left_classes):
+        text.write(f'@kern_left_{index} = [{' '.join(glyph_names)}];\n')
+    for index, glyph_names in enumerate(kerning_classes.right_classes):
+        text.write(f'@kern_right_{index} = [{' '.join(glyph_names)}];\n')
+    text.write('\n')
+    text.write('feature kern {\n')
+    for (left_index, right_index), offset in kerning_classes.values.items():
+        text.write(f'    position @kern_left_{left_index} @kern_right_{right_index} {offset * px_to_units};\n')
+    text.write('} kern;\n')
+    return text.getvalue()
+
+
+def _measure_gpos_size(glyph_order: list[str], feature_text: str) -> int:
+    font = TTFont()
+    font.setGlyphOrder(glyph_order)
+    addOpenTypeFeaturesFromString(font, feature_text)
+    return len(font['GPOS'].compile(font))
+
+
+def make_kerning_report(font_size: FontSize, kerning_values: dict[tuple[str, str], int]) -> Path:
+    px_to_units = opentype.Config().px_to_units
+    kerning_classes = create_kerning_classes(kerning_values)
+    glyph_order = ['.notdef', *sorted({glyph_name for pair in kerning_values for glyph_name in pair})]
+    pair_gpos_size = _measure_gpos_size(glyph_order, build_kern_feature(glyph_order, kerning_values, px_to_units))
+    class_gpos_size = _measure_gpos_size(glyph_order, build_kern_class_feature(kerning_classes, px_to_units))
+
+    path_define.reports_dir.mkdir(parents=True, exist_ok=True)
+    file_path = path_define.reports_dir.joinpath(f'kerning-{font_size}px.md')
+    with file_path.open('w', encoding='utf-8') as file:
+        file.write(f'# Kerning: {font_size}px\n')
+        file.write('\n')
+        file.write(f'templates: {len(configs.kerning_config.templates)}\n')
+        file.write('\n')
+        file.write('| mode | left classes | right classes | rules | GPOS bytes |\n')
+        file.write('|---|---:|---:|---:|---:|\n')
+        file.write(f'| pair | - | - | {len(kerning_values)} | {pair_gpos_size} |\n')
+        file.write(f'| class | {len(kerning_classes.left_classes)} | {len(kerning_classes.right_classes)} | {len(kerning_classes.values)} | {class_gpos_size} |\n')
+    logger.info("Make kerning report: '{}'", file_path)
+    return file_path
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import threading
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+from loguru import logger
+
+from tools import configs
+from tools.configs import path_define
+
+
+def digest_values(*values: object) -> str:
+    hasher = hashlib.sha256()
+    for value in values:
+        hasher.update(repr(value).encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+def digest_files(file_paths: Iterable[Path]) -> str:
+    hasher = hashlib.sha256()
+    for file_path in file_paths:
+        hasher.update(file_path.name.encode('utf-8'))
+        hasher.update(b'\0')
+        hasher.update(hashlib.sha256(file_path.read_bytes()).digest())
+    return hasher.hexdigest()
+
+
+def digest_dir(root_dir: Path) -> str:
+    return digest_files(sorted(file_path for file_path in root_dir.rglob('*') if file_path.is_file()))
+
+
+def _get_tools_digest() -> str:
+    return digest_files(sorted(path_define.project_root_dir.joinpath('tools').rglob('*.py')))
+
+
+class BuildManifest:
+    @staticmethod
+    def load() -> BuildManifest:
+        file_path = path_define.build_dir.joinpath('manifest.json')
+        tools_digest = _get_tools_digest()
+        entries = {}
+        if file_path.is_file():
+            data = json.loads(file_path.read_bytes())
+            if data.get('version') == configs.version and data.get('tools') == tools_digest:
+                entries = data['entries']
+        return BuildManifest(file_path, tools_digest, entries)
+
+    file_path: Path
+    tools_digest: str
+    entries: dict[str, dict[str, str | list[str]]]
+    _lock: threading.Lock
+
+    def __init__(
+            self,
+            file_path: Path,
+            tools_digest: str,
+            entries: dict[str, dict[str, str | list[str]]],
+    ):
+        self.file_path = file_path
+        self.tools_digest = tools_digest
+        self.entries = entries
+        self._lock = threading.Lock()
+
+    def is_up_to_date(self, name: str, digest: str) -> bool:
+        entry = self.entries.get(name)
+        if entry is None or entry['digest'] != digest:
+            return False
+        return all(path_define.build_dir.joinpath(output).is_file() for output in entry['outputs'])
+
+    def update(self, name: str, digest: str, file_paths: list[Path]):
+        entry = {
+            'digest': digest,
+            'outputs': [file_path.relative_to(path_define.build_dir).as_posix() for file_path in file_paths],
+        }
+        with self._lock:
+            self.entries[name] = entry
+
+    def run(self, name: str, digest: str, make: Callable[[], list[Path]]):
+        if self.is_up_to_date(name, digest):
+            logger.info('Skip up-to-date: {}', name)
+            return
+        self.update(name, digest, make())
+
+    def save(self):
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file_path.write_text(json.dumps({
+            'version': configs.version,
+            'tools': self.tools_digest,
+            'entries': dict(sorted(self.entries.items())),
+        }, indent=2), 'utf-8')
@@ -1,24 +1,83 @@
 import re
+import shutil
 import zipfile
+from pathlib import Path
 
 from loguru import logger
 
 from tools import configs
-from tools.configs import path_define, options
-from tools.configs.options import FontSize, FontFormat
+from tools.configs import path_define
+from tools.configs.options import FontSize, FontFormat, FontCollectionFormat
+from tools.services import font_service, manifest_service, trace_service
 
+compress_levels: dict[FontFormat | FontCollectionFormat, int | None] = {
+    'otf': 9,
+    'otf.woff': None,
+    'otf.woff2': None,
+    'ttf': 9,
+    'ttf.woff': None,
+    'ttf.woff2': None,
+    'bdf': 9,
+    'pcf': 9,
+    'otc': 9,
+    'ttc': 9,
+}
 
-def make_release_zips(font_size: FontSize, font_formats: list[FontFormat]):
-    path_define.releases_dir.mkdir(parents=True, exist_ok=True)
+_license_compress_level = 9
+
+
+def get_release_zip_file_path(font_size: FontSize, font_format: FontFormat | FontCollectionFormat) -> Path:
+    return path_define.releases_dir.joinpath(f'capsule-pixel-font-{font_size}px-{font_format}-v{configs.version}.zip')
+
+
+def _create_zip_info(file_name: str, compress_level: int | None) -> zipfile.ZipInfo:
+    zip_info = zipfile.ZipInfo(file_name, (*(int(token) for token in configs.version.split('.')), 0, 0, 0))
+    zip_info.create_system = 3
+    zip_info.external_attr = 0o100644 << 16
+    if compress_level is None:
+        zip_info.compress_type = zipfile.ZIP_STORED
+    else:
+        zip_info.compress_type = zipfile.ZIP_DEFLATED
+        zip_info.compress_level = compress_level
+    return zip_info
+
+
+def _write_entry(file: zipfile.ZipFile, source_file_path: Path, file_name: str, compress_level: int | None):
+    with source_file_path.open('rb') as source_file, file.open(_create_zip_info(file_name, compress_level), 'w') as target_file:
+        shutil.copyfileobj(source_file, target_file, 1024 * 1024)
 
-    for font_format in font_formats:
-        file_path = path_define.releases_dir.joinpath(f'capsule-pixel-font-{font_size}px-{font_format}-v{configs.version}.zip')
-        with zipfile.ZipFile(file_path, 'w') as file:
-            file.write(path_define.project_root_dir.joinpath('LICENSE-OFL'), 'OFL.txt')
-            for language_flavor in options.language_flavors:
-                font_file_name = f'capsule-pixel-{font_size}px-{language_flavor}.{font_format}'
-                file.write(path_define.outputs_dir.joinpath(font_file_name), font_file_name)
-        logger.info("Make release zip: '{}'", file_path)
+
+def _make_release_zip(font_size: FontSize, font_format: FontFormat | FontCollectionFormat) -> Path:
+    compress_level = compress_levels[font_format]
+    license_file_path = path_define.project_root_dir.joinpath('LICENSE-OFL')
+    font_file_paths = font_service.get_font_file_paths(font_size, font_format)
+    digest = manifest_service.digest_values(configs.version, compress_level, manifest_service.digest_files([license_file_path, *font_file_paths])).encode('utf-8')
+
+    file_path = get_release_zip_file_path(font_size, font_format)
+    if file_path.is_file():
+        try:
+            with zipfile.ZipFile(file_path) as file:
+                if file.comment == digest:
+                    logger.info('Skip up-to-date: {}', file_path.name)
+                    return file_path
+        except zipfile.BadZipFile:
+            pass
+
+    temp_file_path = file_path.with_name(f'{file_path.name}.tmp')
+    with zipfile.ZipFile(temp_file_path, 'w') as file:
+        _write_entry(file, license_file_path, 'OFL.txt', _license_compress_level)
+        for font_file_path in font_file_paths:
+            _write_entry(file, font_file_path, font_file_path.name, compress_level)
+        file.comment = digest
+    temp_file_path.replace(file_path)
+    logger.info("Make release zip: '{}'", file_path)
+    return file_path
+
+
+@trace_service.traced
+def make_release_zips(font_size: FontSize, font_formats: list[FontFormat | FontCollectionFormat]) -> list[Path]:
+    path_define.releases_dir.mkdir(parents=True, exist_ok=True)
+    return [_make_release_zip(font_size, font_format) for font_format in font_formats]
 
 
 def update_docs():
@@ -0,0 +1,67 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+
+class Task:
+    name: str
+    func: Callable[[], object]
+    dependencies: list[str]
+    exclusive: bool
+
+    def __init__(
+            self,
+            name: str,
+            func: Callable[[], object],
+            dependencies: list[str],
+            exclusive: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.dependencies = dependencies
+        self.exclusive = exclusive
+
+
+class TaskGraph:
+    tasks: dict[str, Task]
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name: str, func: Callable[[], object], dependencies: list[str] | None = None, exclusive: bool = False):
+        if name in self.tasks:
+            raise ValueError(f'duplicate task: {repr(name)}')
+        dependencies = [] if dependencies is None else dependencies
+        for dependency in dependencies:
+            if dependency not in self.tasks:
+                raise ValueError(f'unknown dependency: {repr(name)} -> {repr(dependency)}')
+        self.tasks[name] = Task(name, func, dependencies, exclusive)
+
+    def run(self, jobs: int = 1):
+        if jobs <= 1:
+            for task in self.tasks.values():
+                task.func()
+            return
+
+        pending = dict(self.tasks)
+        done = set()
+        running: dict[Future, Task] = {}
+        with ThreadPoolExecutor(jobs) as executor:
+            try:
+                while len(pending) > 0 or len(running) > 0:
+                    # Exclusive tasks start their own process pools, so run at most one at a time to stay within the job budget.
+                    exclusive_running = any(task.exclusive for task in running.values())
+                    for task in list(pending.values()):
+                        if task.exclusive and exclusive_running:
+                            continue
+                        if all(dependency in done for dependency in task.dependencies):
+                            pending.pop(task.name)
+                            running[executor.submit(task.func)] = task
+                            exclusive_running = exclusive_running or task.exclusive
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        task = running.pop(future)
+                        future.result()
+                        done.add(task.name)
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
@@ -1,9 +1,16 @@
+import html
+import re
+from collections.abc import Iterator
+from pathlib import Path
+
 import bs4
 from jinja2 import Environment, FileSystemLoader
 from loguru import logger
 
 from tools import configs
 from tools.configs import path_define
+from tools.configs.options import FontSize
+from tools.services import trace_service, webfont_service
 from tools.services.font_service import DesignContext
 
 _environment = Environment(
@@ -13,81 +20,109 @@ _environment = Environment(
 )
 
 
-def _make_html(template_name: str, file_name: str, params: dict[str, object] | None = None):
+def _get_font_url(font_family: str) -> str:
+    return f'{font_family}.otf.woff2'
+
+
+def _get_text_code_points(html: str) -> list[int]:
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    for element in soup.find_all(['head', 'script', 'style']):
+        element.decompose()
+    return sorted({ord(c) for c in soup.get_text()})
+
+
+def _make_html(
+        template_name: str,
+        file_name: str,
+        params: dict[str, object] | None = None,
+        font_sizes: list[FontSize] | None = None,
+        use_webfonts: bool = False,
+        use_subsets: bool = False,
+) -> Path:
     params = {} if params is None else dict(params)
     params['font_configs'] = configs.font_configs
     params['locale_to_language_flavor'] = configs.locale_to_language_flavor
+    params['webfont_font_sizes'] = font_sizes if use_webfonts and not use_subsets else []
+    params['font_url'] = _get_font_url
 
-    html = _environment.get_template(template_name).render(params)
+    template = _environment.get_template(template_name)
+    html = template.render(params)
+    if use_subsets:
+        subset_name = file_name.removesuffix('.html')
+        webfont_service.make_subset_fonts(font_sizes, _get_text_code_points(html), subset_name)
+        params['font_url'] = lambda font_family: f'subsets/{subset_name}/{font_family}.woff2'
+        html = template.render(params)
 
     path_define.outputs_dir.mkdir(parents=True, exist_ok=True)
     file_path = path_define.outputs_dir.joinpath(file_name)
     file_path.write_text(html, 'utf-8')
     logger.info("Make html: '{}'", file_path)
+    return file_path
 
 
-def make_alphabet_html(design_context: DesignContext):
-    _make_html('alphabet.html', f'alphabet-{design_context.font_size}px.html', {
+@trace_service.traced
+def make_alphabet_html(design_context: DesignContext, use_webfonts: bool = False, use_subsets: bool = False) -> Path:
+    return _make_html('alphabet.html', f'alphabet-{design_context.font_size}px.html', {
         'font_config': configs.font_configs[design_context.font_size],
         'alphabet': ''.join(sorted(c for c in design_context.alphabet if ord(c) >= 128)),
-    })
-
-
-def _handle_demo_html_element(alphabet: set[str], soup: bs4.BeautifulSoup, element: bs4.PageElement):
-    if isinstance(element, bs4.element.Tag):
-        for child_element in list(element.contents):
-            _handle_demo_html_element(alphabet, soup, child_element)
-    elif isinstance(element, bs4.element.NavigableString):
-        text = str(element)
-        tmp_parent = soup.new_tag('div')
-        last_status = False
-        text_buffer = ''
-        for c in text:
-            if c == ' ':
-                status = last_status
-            elif c == '\n':
-                status = True
-            else:
-                status = c in alphabet
-            if last_status != status:
-                if text_buffer != '':
-                    if last_status:
-                        tmp_child = bs4.element.NavigableString(text_buffer)
-                    else:
-                        tmp_child = soup.new_tag('span')
-                        tmp_child.string = text_buffer
-                        tmp_child['class'] = f'char-notdef'
-                    tmp_parent.append(tmp_child)
-                    text_buffer = ''
-                last_status = status
-            text_buffer += c
-        if text_buffer != '':
-            if last_status:
-                tmp_child = bs4.element.NavigableString(text_buffer)
-            else:
-                tmp_child = soup.new_tag('span')
-                tmp_child.string = text_buffer
-                tmp_child['class'] = f'char-notdef'
-            tmp_parent.append(tmp_child)
-        element.replace_with(tmp_parent)
-        tmp_parent.unwrap()
-
-
-def make_demo_html(design_context: DesignContext):
+    }, [design_context.font_size], use_webfonts, use_subsets)
+
+
+_html_token_pattern = re.compile(r'<(script|style)\b.*?</\1\s*>|<!--.*?-->|<[/!?]?[A-Za-z][^>]*>', re.IGNORECASE | re.DOTALL)
+
+
+def compile_covered_pattern(alphabet: set[str]) -> re.Pattern[str]:
+    code_points = sorted({ord(c) for c in alphabet if c != ' '} | {ord('\n')})
+    ranges = []
+    for code_point in code_points:
+        if len(ranges) > 0 and ranges[-1][1] == code_point - 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    char_class = ''.join(re.escape(chr(start)) if start == end else f'{re.escape(chr(start))}-{re.escape(chr(end))}' for start, end in ranges)
+    return re.compile(f'[{char_class}][{char_class} ]*')
+
+
+def _iter_text_segments(covered_pattern: re.Pattern[str], text: str) -> Iterator[str]:
+    text = html.unescape(text)
+    position = 0
+    for match in covered_pattern.finditer(text):
+        if match.start() > position:
+            yield f'<span class="char-notdef">{html.escape(text[position:match.start()], False)}</span>'
+        yield html.escape(match.group(), False)
+        position = match.end()
+    if position < len(text):
+        yield f'<span class="char-notdef">{html.escape(text[position:], False)}</span>'
+
+
+def iter_demo_html_segments(covered_pattern: re.Pattern[str], content_html: str) -> Iterator[str]:
+    position = 0
+    for match in _html_token_pattern.finditer(content_html):
+        if match.start() > position:
+            yield from _iter_text_segments(covered_pattern, content_html[position:match.start()])
+        yield match.group()
+        position = match.end()
+    if position < len(content_html):
+        yield from _iter_text_segments(covered_pattern, content_html[position:])
+
+
+@trace_service.traced
+def make_demo_html(design_context: DesignContext, use_webfonts: bool = False, use_subsets: bool = False) -> Path:
     content_html = path_define.templates_dir.joinpath('demo-content.html').read_text('utf-8')
-    soup = bs4.BeautifulSoup(content_html, 'html.parser')
-    _handle_demo_html_element(design_context.alphabet, soup, soup)
-    content_html = str(soup).strip()
+    covered_pattern = compile_covered_pattern(design_context.alphabet)
+    content_html = ''.join(iter_demo_html_segments(covered_pattern, content_html)).strip()
 
-    _make_html('demo.html', f'demo-{design_context.font_size}px.html', {
+    return _make_html('demo.html', f'demo-{design_context.font_size}px.html', {
         'font_config': configs.font_configs[design_context.font_size],
         'content_html': content_html,
-    })
+    }, [design_context.font_size], use_webfonts, use_subsets)
 
 
-def make_index_html():
-    _make_html('index.html', 'index.html')
+@trace_service.traced
+def make_index_html(use_webfonts: bool = False, use_subsets: bool = False) -> Path:
+    return _make_html('index.html', 'index.html', None, list(configs.font_configs), use_webfonts, use_subsets)
 
 
-def make_playground_html():
-    _make_html('playground.html', 'playground.html')
+@trace_service.traced
+def make_playground_html(use_webfonts: bool = False) -> Path:
+    return _make_html('playground.html', 'playground.html', None, list(configs.font_configs), use_webfonts)
@@ -0,0 +1,130 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from loguru import logger
+
+
+class Span:
+    name: str
+    start_time: float
+    duration: float
+    rss_delta: int
+    output_bytes: int
+    thread_id: int
+
+    def __init__(self, name: str, start_time: float, thread_id: int):
+        self.name = name
+        self.start_time = start_time
+        self.duration = 0
+        self.rss_delta = 0
+        self.output_bytes = 0
+        self.thread_id = thread_id
+
+    def add_outputs(self, outputs: object):
+        if isinstance(outputs, Path):
+            outputs = [outputs]
+        if isinstance(outputs, list):
+            for output in outputs:
+                if isinstance(output, Path) and output.is_file():
+                    self.output_bytes += output.stat().st_size
+
+
+_spans: list[Span] | None = None
+_origin_time = time.perf_counter()
+
+
+def _get_rss() -> int:
+    if sys.platform == 'linux':
+        with open('/proc/self/statm', 'rb') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    if sys.platform == 'win32':
+        return 0
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def enable():
+    global _spans
+    _spans = []
+
+
+def is_enabled() -> bool:
+    return _spans is not None
+
+
+@contextmanager
+def span(name: str) -> Iterator[Span | None]:
+    if _spans is None:
+        yield None
+        return
+
+    current = Span(name, time.perf_counter(), threading.get_native_id())
+    rss_start = _get_rss()
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - current.start_time
+        current.rss_delta = _get_rss() - rss_start
+        _spans.append(current)
+
+
+def traced[**P, R](func: Callable[P, R]) -> Callable[P, R]:
+    name = f'{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        with span(name) as current:
+            result = func(*args, **kwargs)
+            if current is not None:
+                current.add_outputs(result)
+            return result
+
+    return wrapper
+
+
+def save_chrome_trace(file_path: Path):
+    pid = os.getpid()
+    events = []
+    for current in _spans:
+        events.append({
+            'name': current.name,
+            'cat': current.name.split('.', 1)[0],
+            'ph': 'X',
+            'ts': (current.start_time - _origin_time) * 1_000_000,
+            'dur': current.duration * 1_000_000,
+            'pid': pid,
+            'tid': current.thread_id,
+            'args': {
+                'rss_delta': current.rss_delta,
+                'output_bytes': current.output_bytes,
+            },
+        })
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(json.dumps({
+        'traceEvents': events,
+        'displayTimeUnit': 'ms',
+    }), 'utf-8')
+    logger.info("Save trace: '{}'", file_path)
+
+
+def log_summary():
+    summary = defaultdict(lambda: [0, 0.0, 0, 0])
+    for current in _spans:
+        item = summary[current.name]
+        item[0] += 1
+        item[1] += current.duration
+        item[2] += current.rss_delta
+        item[3] += current.output_bytes
+
+    logger.info('{:<48} {:>6} {:>10} {:>12} {:>12}', 'span', 'count', 'total ms', 'rss delta', 'output bytes')
+    for name, (count, duration, rss_delta, output_bytes) in sorted(summary.items(), key=lambda item: item[1][1], reverse=True):
+        logger.info('{:<48} {:>6} {:>10.1f} {:>12} {:>12}', name, count, duration * 1000, rss_delta, output_bytes)
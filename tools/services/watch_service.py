@@ -0,0 +1,71 @@
+import os
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from loguru import logger
+
+from tools.configs import path_define
+
+type Snapshot = dict[Path, tuple[int, int]]
+
+watch_dirs = [
+    path_define.configs_dir,
+    path_define.glyphs_dir,
+    path_define.mappings_dir,
+    path_define.kernings_dir,
+    path_define.templates_dir,
+]
+
+
+def take_snapshot(root_dirs: list[Path]) -> Snapshot:
+    snapshot = {}
+    for root_dir in root_dirs:
+        for dir_path, _, file_names in os.walk(root_dir):
+            for file_name in file_names:
+                file_path = Path(dir_path, file_name)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                snapshot[file_path] = stat.st_size, stat.st_mtime_ns
+    return snapshot
+
+
+def get_changed_file_paths(old_snapshot: Snapshot, new_snapshot: Snapshot) -> set[Path]:
+    return {file_path for file_path in old_snapshot.keys() | new_snapshot.keys() if old_snapshot.get(file_path) != new_snapshot.get(file_path)}
+
+
+def watch(
+        on_change: Callable[[set[Path]], None],
+        root_dirs: list[Path] | None = None,
+        interval: float = 0.5,
+        settle_time: float = 0.2,
+):
+    if root_dirs is None:
+        root_dirs = watch_dirs
+
+    snapshot = take_snapshot(root_dirs)
+    logger.info('Watching: {}', ', '.join(str(root_dir.relative_to(path_define.project_root_dir)) for root_dir in root_dirs))
+    try:
+        while True:
+            time.sleep(interval)
+            new_snapshot = take_snapshot(root_dirs)
+            if new_snapshot == snapshot:
+                continue
+            while True:
+                time.sleep(settle_time)
+                settled_snapshot = take_snapshot(root_dirs)
+                if settled_snapshot == new_snapshot:
+                    break
+                new_snapshot = settled_snapshot
+
+            changed_file_paths = get_changed_file_paths(snapshot, new_snapshot)
+            snapshot = new_snapshot
+            logger.info('Changed files: {}', len(changed_file_paths))
+            try:
+                on_change(changed_file_paths)
+            except Exception:
+                logger.exception('Rebuild failed, waiting for next change')
+    except KeyboardInterrupt:
+        logger.info('Stop watching')
@@ -0,0 +1,130 @@
+from io import BytesIO
+from pathlib import Path
+
+import unidata_blocks
+from fontTools import subset
+from fontTools.ttLib import TTFont
+from loguru import logger
+
+from tools.configs import path_define, options
+from tools.configs.options import FontSize
+from tools.services import trace_service
+
+_MIN_SHARD_CODE_POINTS = 32
+
+
+def get_css_file_name(font_size: FontSize) -> str:
+    return f'capsule-pixel-{font_size}px.css'
+
+
+def _split_shards(code_points: list[int]) -> dict[str, list[int]]:
+    shards = {}
+    misc_code_points = []
+    for code_point in sorted(code_points):
+        block = unidata_blocks.get_block_by_code_point(code_point)
+        if block is None:
+            misc_code_points.append(code_point)
+        else:
+            shards.setdefault(f'{block.code_start:04X}-{block.code_end:04X}', []).append(code_point)
+    for shard_name in [shard_name for shard_name, shard_code_points in shards.items() if len(shard_code_points) < _MIN_SHARD_CODE_POINTS]:
+        misc_code_points.extend(shards.pop(shard_name))
+    if len(misc_code_points) > 0:
+        shards['misc'] = sorted(misc_code_points)
+    return shards
+
+
+def _format_unicode_range(code_points: list[int]) -> str:
+    ranges = []
+    for code_point in code_points:
+        if len(ranges) > 0 and ranges[-1][1] == code_point - 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    return ', '.join(f'U+{start:X}' if start == end else f'U+{start:X}-{end:X}' for start, end in ranges)
+
+
+def _create_subset_options() -> subset.Options:
+    subset_options = subset.Options()
+    subset_options.flavor = 'woff2'
+    subset_options.layout_features = ['*']
+    subset_options.name_IDs = ['*']
+    subset_options.name_languages = ['*']
+    subset_options.notdef_outline = True
+    return subset_options
+
+
+def _subset_font(font: TTFont, code_points: list[int]):
+    subsetter = subset.Subsetter(_create_subset_options())
+    subsetter.populate(unicodes=code_points)
+    subsetter.subset(font)
+    font.flavor = 'woff2'
+
+
+@trace_service.traced
+def make_webfonts(font_size: FontSize) -> list[Path]:
+    webfonts_dir = path_define.outputs_dir.joinpath('webfonts')
+    webfonts_dir.mkdir(parents=True, exist_ok=True)
+
+    file_paths = []
+    css_rules = []
+    for language_flavor in options.language_flavors:
+        font_family = f'capsule-pixel-{font_size}px-{language_flavor}'
+        font = TTFont(path_define.outputs_dir.joinpath(f'{font_family}.otf.woff2'), recalcBBoxes=False, recalcTimestamp=False)
+        font.flavor = None
+        buffer = BytesIO()
+        font.save(buffer)
+        data = buffer.getvalue()
+
+        for shard_name, code_points in _split_shards(list(font.getBestCmap())).items():
+            shard_font = TTFont(BytesIO(data), recalcBBoxes=False, recalcTimestamp=False)
+            _subset_font(shard_font, code_points)
+            file_path = webfonts_dir.joinpath(f'{font_family}-{shard_name}.woff2')
+            shard_font.save(file_path)
+            logger.info("Make webfont: '{}'", file_path)
+            file_paths.append(file_path)
+
+            css_rules.append(
+                f'@font-face {{\n'
+                f'    font-family: {font_family};\n'
+                f'    src: url("webfonts/{file_path.name}") format("woff2");\n'
+                f'    unicode-range: {_format_unicode_range(code_points)};\n'
+                f'}}\n'
+            )
+
+    css_file_path = path_define.outputs_dir.joinpath(get_css_file_name(font_size))
+    css_file_path.write_text('\n'.join(css_rules), 'utf-8')
+    logger.info("Make webfonts css: '{}'", css_file_path)
+    file_paths.append(css_file_path)
+    return file_paths
+
+
+@trace_service.traced
+def make_subset_fonts(font_sizes: list[FontSize], code_points: list[int], name: str) -> list[Path]:
+    subset_dir = path_define.outputs_dir.joinpath('subsets', name)
+    subset_dir.mkdir(parents=True, exist_ok=True)
+
+    file_paths = []
+    report_rows = []
+    for font_size in font_sizes:
+        for language_flavor in options.language_flavors:
+            font_family = f'capsule-pixel-{font_size}px-{language_flavor}'
+            full_file_path = path_define.outputs_dir.joinpath(f'{font_family}.otf.woff2')
+            font = TTFont(full_file_path, recalcBBoxes=False, recalcTimestamp=False)
+            _subset_font(font, [code_point for code_point in code_points if code_point in font.getBestCmap()])
+            file_path = subset_dir.joinpath(f'{font_family}.woff2')
+            font.save(file_path)
+            logger.info("Make subset font: '{}'", file_path)
+            file_paths.append(file_path)
+            report_rows.append((font_family, len(font.getBestCmap()), file_path.stat().st_size, full_file_path.stat().st_size))
+
+    path_define.reports_dir.mkdir(parents=True, exist_ok=True)
+    report_file_path = path_define.reports_dir.joinpath(f'subset-{name}.md')
+    with report_file_path.open('w', encoding='utf-8') as file:
+        file.write(f'# Subset fonts: {name}\n')
+        file.write('\n')
+        file.write('| font | chars | subset bytes | full bytes | ratio |\n')
+        file.write('|---|---:|---:|---:|---:|\n')
+        for font_family, chr_count, subset_size, full_size in report_rows:
+            file.write(f'| {font_family} | {chr_count} | {subset_size} | {full_size} | {subset_size / full_size:.2%} |\n')
+    logger.info("Make subset report: '{}'", report_file_path)
+    return file_paths